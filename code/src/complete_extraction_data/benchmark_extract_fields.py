@@ -0,0 +1,72 @@
+import json
+import os
+import re
+import time
+
+from final_extraion_runner import FIELD_PATTERNS, extract_fields, preprocess_email
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__)))
+CORPUS_PATH = os.path.join(BASE_DIR, "..", "resources", "analyzed_emails.json")
+
+# Timed passes over the corpus; the fastest one is reported
+REPEAT = 5
+
+
+def extract_fields_per_pattern(text):
+    """The previous extract_fields: one re.finditer scan of the text per pattern."""
+    fields = {}
+    for field, pattern in FIELD_PATTERNS.items():
+        field_values = []
+        for match in re.finditer(pattern, text, re.IGNORECASE):
+            if match.groups():
+                value = match.group(1)
+                if value:
+                    field_values.append(value.strip())
+        if field_values:
+            fields[field] = field_values
+    return fields
+
+
+def load_corpus(corpus_path=CORPUS_PATH):
+    """Email texts of the corpus, built with preprocess_email as the runner does."""
+    with open(corpus_path, "r", encoding="utf-8") as f:
+        return [preprocess_email(doc) for doc in json.load(f)]
+
+
+def _best_time(extract, texts, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for text in texts:
+            extract(text)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run_benchmark(corpus_path=CORPUS_PATH, repeat=REPEAT):
+    """Checks both implementations agree on the corpus and reports their speed."""
+    texts = load_corpus(corpus_path)
+    mismatches = sum(extract_fields(text) != extract_fields_per_pattern(text) for text in texts)
+    if mismatches:
+        raise SystemExit(f"extract_fields differs from the per-pattern scan on {mismatches} email(s)")
+
+    megabytes = sum(len(text) for text in texts) / 1e6
+    report = {
+        "emails": len(texts),
+        "megabytes": megabytes,
+        "per_pattern_seconds": _best_time(extract_fields_per_pattern, texts, repeat),
+        "single_pass_seconds": _best_time(extract_fields, texts, repeat),
+    }
+    report["speedup"] = report["per_pattern_seconds"] / report["single_pass_seconds"]
+
+    print(f"{report['emails']} emails, {megabytes:.2f} MB of text, identical output")
+    for name in ("per_pattern", "single_pass"):
+        seconds = report[f"{name}_seconds"]
+        print(f"{name:<12} {seconds * 1000:8.1f} ms  {megabytes / seconds:6.1f} MB/s")
+    print(f"Speedup: {report['speedup']:.1f}x")
+    return report
+
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -5,25 +5,84 @@ from transformers import AutoModelForSequenceClassification, AutoTokenizer
 import re
 import datetime
 import logging
+import threading
+from itertools import islice
 from bson.objectid import ObjectId
 
-# Load model and tokenizer
 model_path = "email_classifier_llm_latest"
-tokenizer = AutoTokenizer.from_pretrained(model_path)
-model = AutoModelForSequenceClassification.from_pretrained(model_path)
+# Print the model architecture and classifier weights once the model is loaded
+VERBOSE = False
+
+# Documents per forward pass in classify_emails; texts are sorted by token
+# length first, so each batch is padded to similar lengths
+ANALYSIS_BATCH_SIZE = 16
+# Documents read from MongoDB and analyzed together by main()
+ANALYSIS_CHUNK_SIZE = 256
+
+# How analyze_email(s) classify an email:
+#   "truncate" - subject, body and attachments as one text, cut to 512 tokens
+#   "windows"  - up to WINDOW_TOKEN_BUDGET tokens, body first and then the
+#                attachments, split into overlapping windows whose logits are averaged
+CLASSIFICATION_MODE = "truncate"
+CLASSIFICATION_MODES = ("truncate", "windows")
+# Tokens of an email classified in "windows" mode, special tokens excluded
+WINDOW_TOKEN_BUDGET = 2048
+# Tokens per window, special tokens included, and tokens shared by consecutive windows
+WINDOW_SIZE = 512
+WINDOW_OVERLAP = 64
+# Characters of a segment handed to the tokenizer per token left in the budget,
+# so a huge attachment is never tokenized in full
+WINDOW_CHARS_PER_TOKEN = 8
+
+# Enhanced label mapping
+label_mapping = {
+    0: {"type": "update", "subtype": "information_update"},
+    1: {"type": "request", "subtype": "loan_processing"},
+    2: {"type": "request", "subtype": "account_management"},
+    3: {"type": "request", "subtype": "general_inquiry"}
+}
+unknown_label = {"type": "unknown", "subtype": "unknown"}
+
+# Model and tokenizer, loaded on first use by get_model()
+tokenizer = None
+model = None
+_model_lock = threading.Lock()
 
-# After loading the model, add this check:
-print("Model architecture:")
-print(model)
-
-# Check classifier weights
-print("\nClassifier layer weights:")
-print(model.classifier.state_dict())
+logger = logging.getLogger("EmailClassifierTraining")
 
-# Verify number of classes matches your setup
-print(f"\nNumber of output classes: {model.num_labels}")
 
-logger = logging.getLogger("EmailClassifierTraining")
+def get_model():
+    """
+    Returns (tokenizer, model), loading them on the first call in each
+    process. Safe to call from several threads.
+    """
+    global tokenizer, model
+    if model is None:
+        with _model_lock:
+            if model is None:
+                # Load model and tokenizer
+                loaded_tokenizer = AutoTokenizer.from_pretrained(model_path)
+                loaded_model = AutoModelForSequenceClassification.from_pretrained(model_path)
+                loaded_model.eval()
+                if VERBOSE:
+                    print_model_diagnostics(loaded_model)
+                tokenizer = loaded_tokenizer
+                # Published last: other threads only skip the lock once both are set
+                model = loaded_model
+    return tokenizer, model
+
+
+def print_model_diagnostics(model):
+    """Prints the model architecture, classifier weights and number of classes."""
+    print("Model architecture:")
+    print(model)
+
+    # Check classifier weights
+    print("\nClassifier layer weights:")
+    print(model.classifier.state_dict())
+
+    # Verify number of classes matches your setup
+    print(f"\nNumber of output classes: {model.num_labels}")
 
 
 def extract_attachment_content(attachment):
@@ -53,6 +112,7 @@ def preprocess_email(doc):
 
 def classify_email(email_text, max_length=512):
     """Enhanced classification with proper confidence scoring"""
+    tokenizer, model = get_model()
     inputs = tokenizer(
         email_text,
         return_tensors="pt",
@@ -61,9 +121,6 @@ def classify_email(email_text, max_length=512):
         max_length=max_length
     )
 
-    # Ensure model is in eval mode
-    model.eval()
-
     with torch.no_grad():
         outputs = model(**inputs)
 
@@ -75,33 +132,253 @@ def classify_email(email_text, max_length=512):
     confidence_score = confidence.item()
     predicted_class_id = predicted_class_id.item()
 
-    # Enhanced label mapping
-    label_mapping = {
-        0: {"type": "update", "subtype": "information_update"},
-        1: {"type": "request", "subtype": "loan_processing"},
-        2: {"type": "request", "subtype": "account_management"},
-        3: {"type": "request", "subtype": "general_inquiry"}
-    }
-
-    return label_mapping.get(predicted_class_id, {"type": "unknown", "subtype": "unknown"}), confidence_score
+    return label_mapping.get(predicted_class_id, unknown_label), confidence_score
+
+
+def classify_emails(email_texts, max_length=512, batch_size=None):
+    """
+    Batched classify_email: returns one (classification, confidence) pair
+    per text, in input order.
+
+    The texts are tokenized together without padding and bucketed by token
+    length; each bucket is padded to its longest text and classified with a
+    single forward pass.
+    """
+    email_texts = list(email_texts)
+    if not email_texts:
+        return []
+    tokenizer, _ = get_model()
+
+    encodings = tokenizer(email_texts, truncation=True, max_length=max_length)
+    return _label_logits(_bucketed_logits(encodings["input_ids"], batch_size))
+
+
+def _bucketed_logits(input_ids, batch_size=None):
+    """
+    Runs the model over token id lists bucketed by length, one forward pass
+    per bucket of batch_size lists. Returns a [len(input_ids), num_labels]
+    tensor, in input order.
+    """
+    batch_size = batch_size or ANALYSIS_BATCH_SIZE
+    tokenizer, model = get_model()
+    order = sorted(range(len(input_ids)), key=lambda i: len(input_ids[i]))
+
+    rows = [None] * len(input_ids)
+    for start in range(0, len(order), batch_size):
+        bucket = order[start:start + batch_size]
+        inputs = tokenizer.pad(
+            {"input_ids": [input_ids[i] for i in bucket]},
+            padding=True,
+            return_tensors="pt",
+        )
+        with torch.no_grad():
+            outputs = model(**inputs)
+        for row, index in enumerate(bucket):
+            rows[index] = outputs.logits[row]
+    return torch.stack(rows)
+
+
+def _label_logits(logits):
+    """Maps each row of logits to a (classification, confidence) pair."""
+    probabilities = F.softmax(logits, dim=-1)
+    confidences, predicted_class_ids = torch.max(probabilities, dim=-1)
+    return [
+        (label_mapping.get(predicted_class_id, unknown_label), confidence)
+        for confidence, predicted_class_id in zip(confidences.tolist(), predicted_class_ids.tolist())
+    ]
+
+
+def email_windows(doc, tokenizer, budget=None, window_size=None, overlap=None):
+    """
+    Splits an email into overlapping windows of token ids for "windows" mode.
+
+    The subject and body are tokenized first, then each attachment, until
+    budget tokens are collected; only the start of each segment that can
+    still fit the budget is tokenized. Each window holds at most window_size
+    tokens with [CLS] and [SEP], and shares overlap tokens with
+    the previous window.
+    """
+    budget = budget or WINDOW_TOKEN_BUDGET
+    window_size = window_size or WINDOW_SIZE
+    overlap = WINDOW_OVERLAP if overlap is None else overlap
+    content_size = window_size - tokenizer.num_special_tokens_to_add()
+    if not 0 <= overlap < content_size:
+        raise ValueError(f"Window overlap must be between 0 and {content_size - 1}, got {overlap}")
+
+    segments = [f"{doc.get('subject', '')} {doc.get('body', '')}"]
+    for index, attachment in enumerate(doc.get("attachments", [])):
+        content = extract_attachment_content(attachment)
+        segments.append(f"ATTACHMENTS: {content}" if index == 0 else content)
+
+    token_ids = []
+    for segment in segments:
+        remaining = budget - len(token_ids)
+        if remaining <= 0:
+            break
+        segment_ids = tokenizer(
+            segment[:remaining * WINDOW_CHARS_PER_TOKEN], add_special_tokens=False
+        )["input_ids"]
+        token_ids.extend(segment_ids[:remaining])
+
+    # The classifier is a BERT-style model: [CLS] window [SEP]
+    stride = content_size - overlap
+    return [
+        [tokenizer.cls_token_id] + token_ids[start:start + content_size] + [tokenizer.sep_token_id]
+        for start in range(0, max(len(token_ids) - overlap, 1), stride)
+    ]
+
+
+def classify_emails_windowed(docs, batch_size=None):
+    """
+    Classifies documents in "windows" mode: the windows of all documents run
+    as one length-bucketed batch, and each document's window logits are
+    averaged before the softmax. Returns one (classification, confidence)
+    pair per document, in order.
+    """
+    docs = list(docs)
+    if not docs:
+        return []
+    tokenizer, _ = get_model()
+
+    windows, owners = [], []
+    for index, doc in enumerate(docs):
+        for window in email_windows(doc, tokenizer):
+            windows.append(window)
+            owners.append(index)
+
+    logits = _bucketed_logits(windows, batch_size)
+    owners = torch.tensor(owners)
+    mean_logits = torch.stack([logits[owners == index].mean(dim=0) for index in range(len(docs))])
+    return _label_logits(mean_logits)
+
+
+def _classification_mode():
+    if CLASSIFICATION_MODE not in CLASSIFICATION_MODES:
+        raise ValueError(
+            f"Unknown classification mode {CLASSIFICATION_MODE!r}, expected one of {CLASSIFICATION_MODES}")
+    return CLASSIFICATION_MODE
+
+
+def _build_field_scan(field_keywords):
+    """
+    Compiles the single-pass scan used by extract_fields.
+
+    Every match consumes only the first character of a keyword (the rest is
+    a lookahead), so overlapping keywords are all found. The scan runs on
+    lowercased ASCII text, which lets the regex engine skip to candidate
+    first characters. Returns the regex and the field of each group.
+    """
+    keywords = [(keyword, field) for field, names in field_keywords.items() for keyword in names]
+    for keyword, field in keywords:
+        for other, other_field in keywords:
+            if other_field != field and other.startswith(keyword):
+                # Both would start at the same position and only one is reported
+                raise ValueError(f"Keyword {keyword!r} of {field} is a prefix of {other!r} of {other_field}")
+
+    by_first_char = {}
+    for keyword, field in keywords:
+        by_first_char.setdefault(keyword[0], []).append((keyword[1:], field))
+
+    alternatives = []
+    group_fields = [None]  # Group 0 is the whole match
+    for first_char, rests in by_first_char.items():
+        lookaheads = []
+        for rest, field in rests:
+            lookaheads.append(f"({re.escape(rest)})")
+            group_fields.append(field)
+        alternatives.append(f"{re.escape(first_char)}(?={'|'.join(lookaheads)})")
+    # An SSN has no keyword; its matches start at the first digit
+    alternatives.append(r"\d(?=(\d\d-\d\d-\d{4}))")
+    group_fields.append("ssn")
+    return re.compile("|".join(alternatives)), group_fields
+
+
+def _anchored_finditer(regex, text, starts):
+    """
+    Yields the same matches as regex.finditer(text), given the sorted
+    positions where a match can start.
+    """
+    end = 0
+    for start in starts:
+        if start < end:
+            continue
+        match = regex.match(text, start)
+        if match:
+            yield match
+            end = match.end()
+
+
+def _email_finditer(regex, text):
+    """
+    Yields the same matches as regex.finditer(text) for the email pattern.
+
+    Every match contains an "@" and starts where the run of [\\w.-]
+    characters before it starts, so only those positions are tried.
+    """
+    end = 0
+    at = text.find("@")
+    while at != -1:
+        if at > end:
+            start = at
+            while start > end and (text[start - 1].isalnum() or text[start - 1] in "_.-"):
+                start -= 1
+            if start < at:
+                match = regex.match(text, start)
+                if match:
+                    yield match
+                    end = match.end()
+        at = text.find("@", at + 1)
+
+
+# Field patterns of extract_fields, compiled once per process
+FIELD_PATTERNS = {
+    'account_number': r'(?:account|acct)[\s#:]*(\d{4,})',
+    'loan_amount': r'(?:loan|amount)[\s$:]*([\d,]+)',
+    'customer_name': r'(?:name|contact)[\s:]*([^\n\r]+)',
+    'phone': r'(?:phone|mobile|tel)[\s:]*([\+\(\)\d\s-]{7,})',
+    'email': r'([\w\.-]+@[\w\.-]+)',
+    'ssn': r'(\d{3}-\d{2}-\d{4})',
+    'address': r'(?:address|addr)[\s:]*([^\n\r]+)'
+}
+# Keywords every match of a field pattern starts with; must stay in sync with FIELD_PATTERNS
+FIELD_KEYWORDS = {
+    'account_number': ('account', 'acct'),
+    'loan_amount': ('loan', 'amount'),
+    'customer_name': ('name', 'contact'),
+    'phone': ('phone', 'mobile', 'tel'),
+    'address': ('address', 'addr'),
+}
+_field_regexes = {field: re.compile(pattern, re.IGNORECASE) for field, pattern in FIELD_PATTERNS.items()}
+_field_scan, _field_scan_groups = _build_field_scan(FIELD_KEYWORDS)
 
 
 def extract_fields(text):
-    """Enhanced field extraction with more patterns and error handling"""
-    fields = {}
-    patterns = {
-        'account_number': r'(?:account|acct)[\s#:]*(\d{4,})',
-        'loan_amount': r'(?:loan|amount)[\s$:]*([\d,]+)',
-        'customer_name': r'(?:name|contact)[\s:]*([^\n\r]+)',
-        'phone': r'(?:phone|mobile|tel)[\s:]*([\+\(\)\d\s-]{7,})',
-        'email': r'([\w\.-]+@[\w\.-]+)',
-        'ssn': r'(\d{3}-\d{2}-\d{4})',
-        'address': r'(?:address|addr)[\s:]*([^\n\r]+)'
-    }
+    """
+    Enhanced field extraction with more patterns and error handling.
+
+    One scan finds where each field's keywords (and SSNs) occur; each pattern
+    is then only tried at those positions, and skipped when there are none.
+    The results are the same as running re.finditer with every pattern.
+    """
+    if text.isascii():
+        starts = {}
+        for match in _field_scan.finditer(text.lower()):
+            starts.setdefault(_field_scan_groups[match.lastindex], []).append(match.start())
+    else:
+        # Case folding of non-ASCII text can change lengths; scan with every pattern
+        starts = None
 
-    for field, pattern in patterns.items():
+    fields = {}
+    for field, regex in _field_regexes.items():
         try:
-            matches = re.finditer(pattern, text, re.IGNORECASE)
+            if field == 'email':
+                matches = _email_finditer(regex, text)
+            elif starts is None:
+                matches = regex.finditer(text)
+            elif field in starts:
+                matches = _anchored_finditer(regex, text, starts[field])
+            else:
+                continue
             field_values = []
             for match in matches:
                 if match.groups():  # Check if any groups were captured
@@ -117,29 +394,70 @@ def extract_fields(text):
     return fields
 
 
+# Marker preprocess_email puts between the email body and the attachment content
+ATTACHMENTS_MARKER = " ATTACHMENTS: "
+# Characters of attachment content analyze_intent looks at; None scans all of it
+INTENT_MAX_ATTACHMENT_CHARS = 20000
+
+# Intent keyword groups, highest precedence first
+INTENT_KEYWORDS = [
+    ("urgent", ("urgent", "immediately", "asap")),
+    ("loan_related", ("loan",)),
+    ("account_related", ("account",)),
+    ("information_update", ("update",)),
+    ("general_inquiry", ("question", "inquiry", "help")),
+]
+
+
 def analyze_intent(text):
-    """Determine the intent of the email"""
+    """
+    Determine the intent of the email.
+
+    The keyword groups are checked in precedence order and the first group
+    found wins. Only the first INTENT_MAX_ATTACHMENT_CHARS characters after
+    the attachments marker are lowercased and scanned.
+    """
+    marker = text.find(ATTACHMENTS_MARKER)
+    if marker != -1 and INTENT_MAX_ATTACHMENT_CHARS is not None:
+        text = text[:marker + len(ATTACHMENTS_MARKER) + INTENT_MAX_ATTACHMENT_CHARS]
     text_lower = text.lower()
-    intent = "unknown"
-
-    if any(word in text_lower for word in ["urgent", "immediately", "asap"]):
-        intent = "urgent"
-    elif "loan" in text_lower:
-        intent = "loan_related"
-    elif "account" in text_lower:
-        intent = "account_related"
-    elif "update" in text_lower:
-        intent = "information_update"
-    elif any(word in text_lower for word in ["question", "inquiry", "help"]):
-        intent = "general_inquiry"
 
-    return intent
+    for intent, keywords in INTENT_KEYWORDS:
+        # str.find is a C substring search, faster here than one regex alternation
+        if any(keyword in text_lower for keyword in keywords):
+            return intent
+    return "unknown"
 
 
 def analyze_email(doc):
     """Complete email analysis pipeline"""
     email_text = preprocess_email(doc)
-    classification, confidence = classify_email(email_text)
+    if _classification_mode() == "windows":
+        classification, confidence = classify_emails_windowed([doc])[0]
+    else:
+        classification, confidence = classify_email(email_text)
+    return _analysis_result(email_text, classification, confidence)
+
+
+def analyze_emails(docs, batch_size=None):
+    """
+    Batched analyze_email: classifies all documents in one call to
+    classify_emails (or classify_emails_windowed in "windows" mode),
+    then runs field extraction and intent analysis per document. Returns
+    one analysis per document, in order.
+    """
+    email_texts = [preprocess_email(doc) for doc in docs]
+    if _classification_mode() == "windows":
+        classifications = classify_emails_windowed(docs, batch_size=batch_size)
+    else:
+        classifications = classify_emails(email_texts, batch_size=batch_size)
+    return [
+        _analysis_result(email_text, classification, confidence)
+        for email_text, (classification, confidence) in zip(email_texts, classifications)
+    ]
+
+
+def _analysis_result(email_text, classification, confidence):
     extracted_fields = extract_fields(email_text)
     intent = analyze_intent(email_text)
 
@@ -160,22 +478,35 @@ def main():
     db = client["emails_train_db30"]
     collection = db["emails_train30"]
 
-    # Process each email document
-    for doc in collection.find({"is_duplicate": False}):
+    # Process the email documents, one chunk at a time
+    cursor = iter(collection.find({"is_duplicate": False}))
+    while True:
+        docs = list(islice(cursor, ANALYSIS_CHUNK_SIZE))
+        if not docs:
+            break
         try:
-            analysis_result = analyze_email(doc)
-
-            # Update the document with full analysis
-            collection.update_one(
-                {"_id": ObjectId(doc["_id"])},
-                {"$set": {
-                    "analysis": analysis_result
-                }}
-            )
-            print(
-                f"Processed document {doc['_id']} with confidence {analysis_result['confidence']:.2f}")
+            analysis_results = analyze_emails(docs)
         except Exception as e:
-            print(f"Error processing document {doc['_id']}: {str(e)}")
+            # Fall back to one document at a time so one bad document only fails itself
+            print(f"Error analyzing a chunk of {len(docs)} documents, retrying one by one: {str(e)}")
+            analysis_results = [None] * len(docs)
+
+        for doc, analysis_result in zip(docs, analysis_results):
+            try:
+                if analysis_result is None:
+                    analysis_result = analyze_email(doc)
+
+                # Update the document with full analysis
+                collection.update_one(
+                    {"_id": ObjectId(doc["_id"])},
+                    {"$set": {
+                        "analysis": analysis_result
+                    }}
+                )
+                print(
+                    f"Processed document {doc['_id']} with confidence {analysis_result['confidence']:.2f}")
+            except Exception as e:
+                print(f"Error processing document {doc['_id']}: {str(e)}")
 
     print("Document classification and analysis completed.")
 
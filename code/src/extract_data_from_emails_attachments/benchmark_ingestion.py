@@ -0,0 +1,356 @@
+import io
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import tempfile
+import time
+import zipfile
+from datetime import datetime, timedelta
+from email.mime.text import MIMEText
+
+import bson
+from docx import Document
+from openpyxl import Workbook
+from PIL import Image, ImageDraw
+from pymongo import MongoClient
+
+from extract_email_content_to_mongodb import MONGO_CONNECTION_STRING, process_files_in_parallel
+from generate_emails_from_json import create_email_from_json_file
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__)))
+TEMPLATE_DATASET_PATH = os.path.join(
+    BASE_DIR, "..", "resources", "email_datasets.json")
+
+# Benchmark defaults
+NUM_EMAILS = 500
+# Relative weight of each attachment type in the synthetic mailbox
+ATTACHMENT_MIX = {
+    "docx": 1,
+    "xlsx": 1,
+    "pdf": 1,
+    "png": 1,
+    "zip": 1,
+    "msg": 1,
+}
+MAX_ATTACHMENTS_PER_EMAIL = 3
+DUPLICATE_RATE = 0.1
+RANDOM_SEED = 42
+# Use a local mongod instead of the in-memory stand-in
+USE_MONGO = False
+# Throwaway database the benchmark writes to on mongod, dropped after each run
+BENCH_DB_NAME = "ingestion_benchmark"
+
+
+class InMemoryCollection:
+    """Stand-in for a pymongo collection that keeps documents in memory.
+
+    Documents are still BSON-encoded so the benchmark pays a realistic
+    serialisation cost without a running mongod.
+    """
+
+    def __init__(self):
+        self.documents = {}
+
+    def _upsert(self, filter_doc, update_doc):
+        document = update_doc["$set"]
+        bson.encode(document)
+        key = filter_doc["filename"]
+        inserted = key not in self.documents
+        self.documents[key] = document
+        return inserted
+
+    def update_one(self, filter_doc, update_doc, upsert=False):
+        inserted = self._upsert(filter_doc, update_doc)
+        return InMemoryResult(upserted_id=filter_doc["filename"] if inserted else None)
+
+    def bulk_write(self, operations, ordered=True):
+        upserted_ids = {}
+        for index, operation in enumerate(operations):
+            if self._upsert(operation._filter, operation._doc):
+                upserted_ids[index] = operation._filter["filename"]
+        return InMemoryResult(upserted_ids=upserted_ids)
+
+
+class InMemoryResult:
+    def __init__(self, upserted_id=None, upserted_ids=None):
+        self.upserted_id = upserted_id
+        self.upserted_ids = upserted_ids or {}
+
+
+class InMemoryDatabase:
+    def __init__(self):
+        self.collections = {}
+
+    def __getitem__(self, name):
+        return self.collections.setdefault(name, InMemoryCollection())
+
+
+class InMemoryMongoClient:
+    """Stand-in for MongoClient; each worker process gets its own store."""
+
+    def __init__(self, *args, **kwargs):
+        self.databases = {}
+
+    def __getitem__(self, name):
+        return self.databases.setdefault(name, InMemoryDatabase())
+
+    def close(self):
+        pass
+
+
+class BenchmarkMongoClient:
+    """MongoClient that sends every database lookup to BENCH_DB_NAME.
+
+    Keeps synthetic BENCH* documents out of the collections the classifier
+    and analysis runners read.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.client = MongoClient(*args, **kwargs)
+
+    def __getitem__(self, name):
+        return self.client[BENCH_DB_NAME]
+
+    def close(self):
+        self.client.close()
+
+
+def drop_benchmark_database():
+    client = MongoClient(MONGO_CONNECTION_STRING)
+    try:
+        client.drop_database(BENCH_DB_NAME)
+    finally:
+        client.close()
+
+
+def _make_pdf(lines):
+    """Builds a minimal single-page PDF with one text line per entry."""
+    text_ops = " ".join(
+        f"({line}) Tj 0 -16 Td" for line in lines)
+    stream = f"BT /F1 12 Tf 72 720 Td {text_ops} ET"
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        "<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+        "/Resources << /Font << /F1 5 0 R >> >> /Contents 4 0 R >>",
+        f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream",
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    pdf = "%PDF-1.4\n"
+    offsets = []
+    for number, obj in enumerate(objects, start=1):
+        offsets.append(len(pdf))
+        pdf += f"{number} 0 obj\n{obj}\nendobj\n"
+    xref_offset = len(pdf)
+    pdf += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n"
+    pdf += "".join(f"{offset:010d} 00000 n \n" for offset in offsets)
+    pdf += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n"
+    return pdf.encode("latin-1")
+
+
+def _make_docx(lines):
+    document = Document()
+    for line in lines:
+        document.add_paragraph(line)
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
+
+
+def _make_xlsx(rng):
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.append(["Account", "Customer", "Amount"])
+    for _ in range(200):
+        sheet.append([rng.randint(100000, 999999), "Customer",
+                      rng.randint(1000, 500000)])
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+def _make_png(lines):
+    image = Image.new("RGB", (1600, 1200), "white")
+    draw = ImageDraw.Draw(image)
+    for number, line in enumerate(lines):
+        draw.text((40, 40 + number * 30), line, fill="black")
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def _make_zip(lines):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zip_file:
+        zip_file.writestr("notes.txt", "\n".join(lines))
+        zip_file.writestr("statement.pdf", _make_pdf(lines))
+        zip_file.writestr("details.docx", _make_docx(lines))
+    return buffer.getvalue()
+
+
+def _make_msg(lines):
+    message = MIMEText("\n".join(lines))
+    message["From"] = "Forwarded Sender <forwarded@example.com>"
+    message["Subject"] = "Forwarded request"
+    return message.as_bytes()
+
+
+def write_attachment_library(attachment_folder, rng):
+    """Writes one sample attachment per supported type and returns their names."""
+    os.makedirs(attachment_folder, exist_ok=True)
+    lines = [
+        "Account No: 981208",
+        "Loan Amount: $50,000",
+        "Name: Synthetic Customer",
+        "Phone: +1-234-567-8901",
+    ]
+    builders = {
+        "docx": lambda: _make_docx(lines),
+        "xlsx": lambda: _make_xlsx(rng),
+        "pdf": lambda: _make_pdf(lines),
+        "png": lambda: _make_png(lines),
+        "zip": lambda: _make_zip(lines),
+        "msg": lambda: _make_msg(lines),
+    }
+    names = {}
+    for ext, build in builders.items():
+        names[ext] = f"sample.{ext}"
+        with open(os.path.join(attachment_folder, names[ext]), "wb") as f:
+            f.write(build())
+    return names
+
+
+def _load_templates():
+    """Subjects and bodies to reuse, taken from the real dataset when present."""
+    if os.path.exists(TEMPLATE_DATASET_PATH):
+        with open(TEMPLATE_DATASET_PATH, "r", encoding="utf-8") as f:
+            return [(item["subject"], item["body"]) for item in json.load(f)]
+    return [("Loan request", "Please process my loan for account 981208.")]
+
+
+def generate_synthetic_mailbox(output_folder, num_emails=NUM_EMAILS, attachment_mix=None,
+                               max_attachments=MAX_ATTACHMENTS_PER_EMAIL,
+                               duplicate_rate=DUPLICATE_RATE, seed=RANDOM_SEED, processes=1):
+    """Generates a reproducible mailbox of .eml files with create_email_from_json_file.
+
+    Returns the folder holding the .eml files.
+    """
+    rng = random.Random(seed)
+    attachment_mix = attachment_mix or ATTACHMENT_MIX
+    attachment_folder = os.path.join(output_folder, "attachments")
+    email_folder = os.path.join(output_folder, "emails")
+    attachment_names = write_attachment_library(attachment_folder, rng)
+
+    kinds = [kind for kind, weight in attachment_mix.items() if weight > 0]
+    weights = [attachment_mix[kind] for kind in kinds]
+    templates = _load_templates()
+    received_at = datetime(2025, 1, 1)
+
+    email_data_list = []
+    for number in range(num_emails):
+        subject, body = templates[number % len(templates)]
+        count = rng.randint(0, max_attachments) if kinds else 0
+        attachments = sorted({attachment_names[kind]
+                              for kind in rng.choices(kinds, weights, k=count)})
+        email_data_list.append({
+            "email_id": f"BENCH{number:07d}",
+            "sender": "Synthetic Sender",
+            "sender_email": f"sender{number % 97}@example.com",
+            "subject": subject,
+            "body": body,
+            "attachments": attachments,
+            "received_at": (received_at + timedelta(minutes=number)).isoformat(timespec="microseconds"),
+            "is_duplicate": rng.random() < duplicate_rate,
+        })
+
+    json_file_path = os.path.join(output_folder, "dataset.json")
+    with open(json_file_path, "w", encoding="utf-8") as f:
+        json.dump(email_data_list, f)
+
+    create_email_from_json_file(json_file_path, attachment_folder, email_folder,
+                                processes=processes)
+    return email_folder
+
+
+def _peak_rss_mb():
+    """Peak RSS of this process and of the largest worker process, in MB."""
+    if resource is None:
+        return None, None
+    # ru_maxrss is reported in KB on Linux
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    return own, children
+
+
+def run_benchmark(num_emails=NUM_EMAILS, attachment_mix=None, pool_size=None, batch_size=None,
+                  use_mongo=USE_MONGO, seed=RANDOM_SEED, work_dir=None, report_path=None):
+    """Generates a synthetic mailbox, ingests it and reports throughput.
+
+    The report holds files/sec, MB/sec, peak RSS and the cost of every
+    extractor, taken from the per-stage timings of process_files_in_parallel.
+    With use_mongo the emails are written to BENCH_DB_NAME on a local mongod,
+    which is dropped at the end of the run.
+    """
+    own_dir = work_dir is None
+    work_dir = work_dir or tempfile.mkdtemp(prefix="ingestion_benchmark_")
+    try:
+        generate_started = time.perf_counter()
+        email_folder = generate_synthetic_mailbox(
+            work_dir, num_emails=num_emails, attachment_mix=attachment_mix, seed=seed,
+            processes=pool_size or multiprocessing.cpu_count())
+        generate_seconds = time.perf_counter() - generate_started
+
+        stats = process_files_in_parallel(
+            email_folder, pool_size=pool_size, batch_size=batch_size,
+            client_factory=BenchmarkMongoClient if use_mongo else InMemoryMongoClient)
+        timings = stats["timings"]
+        own_rss, worker_rss = _peak_rss_mb()
+
+        report = {
+            "num_emails": num_emails,
+            "files": timings["files"],
+            "generate_seconds": generate_seconds,
+            "ingest_seconds": timings["elapsed_seconds"],
+            "files_per_sec": timings["files_per_sec"],
+            "mb_per_sec": timings["bytes_per_sec"] / 1e6,
+            "peak_rss_mb": own_rss,
+            "peak_worker_rss_mb": worker_rss,
+            "extractors": {
+                stage: {
+                    "count": row["count"],
+                    "mean_ms": row["total_seconds"] / row["count"] * 1000,
+                    "p95_ms": row["p95"] * 1000,
+                }
+                for stage, row in timings["stages"].items()
+                if stage.startswith("attachment_") or stage == "ocr"
+            },
+        }
+    finally:
+        if own_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        if use_mongo:
+            drop_benchmark_database()
+
+    print(f"Ingested {report['files']} file(s) in {report['ingest_seconds']:.1f}s: "
+          f"{report['files_per_sec']:.1f} files/s, {report['mb_per_sec']:.2f} MB/s")
+    if own_rss is not None:
+        print(f"Peak RSS: {own_rss:.0f} MB (parent), {worker_rss:.0f} MB (largest worker)")
+    for stage, row in sorted(report["extractors"].items()):
+        print(f"{stage:<28}{row['count']:>8} calls {row['mean_ms']:>10.1f} ms mean "
+              f"{row['p95_ms']:>10.1f} ms p95")
+
+    if report_path:
+        with open(report_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    run_benchmark(report_path=os.path.join(BASE_DIR, "benchmark_report.json"))
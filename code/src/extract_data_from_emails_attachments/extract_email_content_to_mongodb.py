@@ -1,16 +1,26 @@
+import hashlib
 import io
+import json
+import math
 import multiprocessing
+import multiprocessing.util
 import os
+import sqlite3
 import tempfile
+import time
 import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
 from email import message_from_bytes
+from functools import partial
 
 import pytesseract
 from docx import Document
 from openpyxl import load_workbook
-from PIL import Image
-from pymongo import MongoClient
+from PIL import Image, ImageStat
+from pymongo import MongoClient, UpdateOne
+from pymongo.errors import BulkWriteError
 from PyPDF2 import PdfReader
 
 # Configure Tesseract OCR
@@ -21,27 +31,304 @@ MONGO_CONNECTION_STRING = "mongodb://localhost:27017/"
 DB_NAME = "emails_train_db30"
 COLLECTION_NAME = "emails_train30"
 
+# Number of worker processes used by process_files_in_parallel
+POOL_SIZE = multiprocessing.cpu_count()
+
+# Paths handed to each worker per task by Pool.imap_unordered
+IMAP_CHUNKSIZE = 16
+
+# Bulk-write mode: upserts per bulk_write and max seconds a parsed email may wait.
+# Each worker process buffers its own parsed emails; paths are still dispatched
+# IMAP_CHUNKSIZE at a time so every worker gets files.
+BULK_BATCH_SIZE = 500
+BULK_FLUSH_INTERVAL = 5.0
+
+# Incremental mode: SQLite manifest of files already written to MongoDB
+MANIFEST_PATH = os.path.join(os.path.dirname(
+    os.path.abspath(__file__)), "resources", "ingest_manifest.sqlite")
+
+# OCR: tesseract processes per ingestion worker and seconds allowed per image frame
+OCR_MAX_WORKERS = 2
+OCR_TIMEOUT = 60
+
+# OCR pre-processing: downscale to OCR_TARGET_DPI (longest side capped at
+# OCR_MAX_SIDE pixels), grayscale, optionally binarize, and skip images that are
+# smaller than OCR_MIN_SIDE pixels or nearly blank (low pixel standard deviation)
+OCR_PREPROCESS = True
+OCR_TARGET_DPI = 300
+OCR_MAX_SIDE = 3300
+OCR_MIN_SIDE = 16
+OCR_BLANK_STDDEV = 4.0
+OCR_BINARIZE = False
+
+# Per-sheet limits for .xlsx text extraction
+XLSX_MAX_ROWS_PER_SHEET = 10000
+XLSX_MAX_CHARS_PER_SHEET = 1000000
+
+# PDF text budget: first PDF_MAX_PAGES pages and at most PDF_MAX_CHARS characters
+# (None disables a limit)
+PDF_MAX_PAGES = 20
+PDF_MAX_CHARS = 200000
+
+# Zip bomb limits: entries (read or skipped), uncompressed bytes per entry and in
+# total, and the largest uncompressed/compressed ratio accepted for an entry. The
+# entry and total budgets are shared by every archive nested in one top-level attachment.
+ZIP_MAX_ENTRIES = 1000
+ZIP_MAX_ENTRY_BYTES = 50 * 1024 * 1024
+ZIP_MAX_TOTAL_BYTES = 200 * 1024 * 1024
+ZIP_MAX_RATIO = 100
+
+# Deepest chain of containers (msg-in-msg-in-zip...) that is still opened
+MAX_ATTACHMENT_DEPTH = 5
+
+# Attachment extraction cache keyed by payload SHA-256; set a directory to enable
+ATTACHMENT_CACHE_DIR = None
+ATTACHMENT_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+# Results that depend on the attachment name, on transient failures or on a depth cutoff
+_UNCACHEABLE_TYPES = {"error", "msg_error", "unsupported"}
+_cache_bytes_since_evict = 0
+# Set while extracting when any nested result was uncacheable, so the
+# containers around it are not cached either
+_extract_uncacheable = False
+
+# Save each email's per-stage timings as a 'timings' sub-document
+STORE_TIMINGS = False
+
+# Per-process MongoDB state, created once by init_worker and reused for every file
+_client = None
+_collection = None
+_connections_opened = None
+_files_processed = None
+_manifest = None
+# Mailbox folder of the run; documents are keyed on their path relative to it
+_msg_folder = None
+
+# Per-process bulk-write buffer: (file_path, email_data) pairs waiting for the
+# next flush, their manifest fingerprints, and where the final flush reports to
+_pending = []
+_pending_fingerprints = {}
+_last_flush = None
+_flush_results = None
+
+# Per-process OCR pool and the optional semaphore shared by all workers
+_ocr_executor = None
+_ocr_semaphore = None
+
+# Stage timings of the email currently being processed: {stage: [seconds, bytes]}
+_timings = None
+
+
+def _record_timing(stage, seconds, nbytes=0):
+    """Adds a duration to the current email's timings, if one is being timed."""
+    if _timings is not None:
+        entry = _timings.setdefault(stage, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += nbytes
+
+
+@contextmanager
+def timed(stage, nbytes=0):
+    """Context manager that records how long its block took under stage."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _record_timing(stage, time.perf_counter() - start, nbytes)
+
+
+def _percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    index = max(0, math.ceil(fraction * len(sorted_values)) - 1)
+    return sorted_values[min(index, len(sorted_values) - 1)]
+
+
+class IngestionStats:
+    """Aggregates per-email stage timings into latency and throughput figures."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.files = 0
+        self.bytes = 0
+        self.stages = {}
+
+    def add_stage(self, stage, seconds, nbytes=0):
+        entry = self.stages.setdefault(stage, {"seconds": [], "bytes": 0})
+        entry["seconds"].append(seconds)
+        entry["bytes"] += nbytes
+
+    def add_email(self, timings):
+        """Adds the {stage: [seconds, bytes]} timings of one processed email."""
+        if not timings:
+            return
+        self.files += 1
+        self.bytes += timings.get("read", [0.0, 0])[1]
+        for stage, (seconds, nbytes) in timings.items():
+            self.add_stage(stage, seconds, nbytes)
+
+    def summary(self):
+        """Returns p50/p95/p99 latency and throughput for every stage."""
+        elapsed = time.perf_counter() - self.started
+        stages = {}
+        for stage, entry in sorted(self.stages.items()):
+            seconds = sorted(entry["seconds"])
+            total = sum(seconds)
+            stages[stage] = {
+                "count": len(seconds),
+                "total_seconds": total,
+                "p50": _percentile(seconds, 0.50),
+                "p95": _percentile(seconds, 0.95),
+                "p99": _percentile(seconds, 0.99),
+                "bytes_per_sec": entry["bytes"] / total if total and entry["bytes"] else None,
+            }
+        return {
+            "elapsed_seconds": elapsed,
+            "files": self.files,
+            "bytes": self.bytes,
+            "files_per_sec": self.files / elapsed if elapsed else 0.0,
+            "bytes_per_sec": self.bytes / elapsed if elapsed else 0.0,
+            "stages": stages,
+        }
+
+    def print_summary(self):
+        summary = self.summary()
+        print(f"Processed {summary['files']} file(s), {summary['bytes'] / 1e6:.1f} MB in "
+              f"{summary['elapsed_seconds']:.1f}s ({summary['files_per_sec']:.1f} files/s, "
+              f"{summary['bytes_per_sec'] / 1e6:.2f} MB/s)")
+        print(f"{'Stage':<28}{'Count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'Total s':>10}{'MB/s':>10}")
+        for stage, row in summary["stages"].items():
+            rate = f"{row['bytes_per_sec'] / 1e6:.2f}" if row["bytes_per_sec"] else "-"
+            print(f"{stage:<28}{row['count']:>8}{row['p50'] * 1000:>10.1f}{row['p95'] * 1000:>10.1f}"
+                  f"{row['p99'] * 1000:>10.1f}{row['total_seconds']:>10.2f}{rate:>10}")
+        return summary
+
+
+def _get_ocr_executor():
+    """Returns the OCR thread pool for this process, creating it on first use.
+
+    pytesseract runs tesseract as a subprocess, so threads are enough to keep
+    several images in flight; the GIL is released while each one waits.
+    """
+    global _ocr_executor
+    if _ocr_executor is None:
+        # One core per tesseract process, parallelism comes from the pool
+        os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+        _ocr_executor = ThreadPoolExecutor(
+            max_workers=OCR_MAX_WORKERS, thread_name_prefix="ocr")
+    return _ocr_executor
+
+
+def preprocess_image_for_ocr(image):
+    """Prepares an image for tesseract, or returns None if it cannot hold text.
+
+    The image is converted to grayscale and downscaled so it is no denser than
+    OCR_TARGET_DPI and no longer than OCR_MAX_SIDE on either side. Phone photos
+    are usually far larger than tesseract needs, and OCR time grows with pixels.
+    """
+    width, height = image.size
+    if min(width, height) < OCR_MIN_SIDE:
+        return None
+
+    gray = image.convert("L")
+
+    scale = 1.0
+    dpi = image.info.get("dpi")
+    if dpi and dpi[0] and dpi[0] > OCR_TARGET_DPI:
+        scale = OCR_TARGET_DPI / float(dpi[0])
+    scale = min(scale, OCR_MAX_SIDE / float(max(width, height)))
+    if scale < 1.0:
+        gray = gray.resize((max(1, round(width * scale)),
+                            max(1, round(height * scale))), Image.LANCZOS)
+
+    stat = ImageStat.Stat(gray)
+    if stat.stddev[0] < OCR_BLANK_STDDEV:
+        return None
+
+    if OCR_BINARIZE:
+        threshold = stat.mean[0]
+        gray = gray.point(lambda pixel: 255 if pixel > threshold else 0)
+    return gray
+
+
+def _ocr_frame(frame):
+    """Runs tesseract on one frame, holding the shared OCR slot if there is one."""
+    if OCR_PREPROCESS:
+        try:
+            prepared = preprocess_image_for_ocr(frame)
+        except Exception:
+            # Pre-processing is only an optimisation, OCR the original instead
+            prepared = frame
+        if prepared is None:
+            return ""
+        frame = prepared
+
+    if _ocr_semaphore is None:
+        return pytesseract.image_to_string(frame, timeout=OCR_TIMEOUT)
+    with _ocr_semaphore:
+        return pytesseract.image_to_string(frame, timeout=OCR_TIMEOUT)
+
 
 def extract_text_from_image(image_bytes):
-    """Extracts text from an image using OCR."""
+    """Extracts text from an image using OCR.
+
+    Every frame of a multi-frame image (e.g. a scanned TIFF) is submitted to
+    the OCR pool separately and the texts are joined in frame order.
+    """
+    futures = []
     try:
         image = Image.open(io.BytesIO(image_bytes))
-        return pytesseract.image_to_string(image)
+        frame_count = int(getattr(image, "n_frames", 1))
+        if frame_count > 1:
+            frames = []
+            for index in range(frame_count):
+                image.seek(index)
+                frames.append(image.copy())
+        else:
+            frames = [image]
+
+        with timed("ocr", len(image_bytes)):
+            executor = _get_ocr_executor()
+            futures = [executor.submit(_ocr_frame, frame) for frame in frames]
+            return "\n".join(future.result() for future in futures)
     except Exception as e:
+        for future in futures:
+            future.cancel()
         return f"OCR Error: {e}"
 
 
-def process_msg_attachment(attachment_name, attachment_content):
-    """Processes .msg attachment and extracts its content."""
-    try:
-        # Create a temporary file to process the .msg
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.msg') as tmp:
-            tmp.write(attachment_content)
-            tmp_path = tmp.name
+def _attachment_extension(attachment_name):
+    """Returns the lower-cased file extension of an attachment name."""
+    return os.path.splitext(attachment_name)[1].lower() if attachment_name else ''
+
+
+class ZipBudget:
+    """Zip entries and uncompressed bytes left for one top-level attachment.
+
+    The budget is handed down through every msg and zip nested inside the
+    attachment, so nesting archives does not multiply the ZIP_MAX_* limits.
+    """
 
-        # Process the .msg file similar to main email processing
-        with open(tmp_path, 'rb') as msg_file:
-            msg = message_from_bytes(msg_file.read())
+    def __init__(self, entries=None, total_bytes=None):
+        self.entries = ZIP_MAX_ENTRIES if entries is None else entries
+        self.bytes = ZIP_MAX_TOTAL_BYTES if total_bytes is None else total_bytes
+
+
+def _extract_msg_attachment(attachment_name, attachment_content, depth=0, budget=None):
+    """Extracts the headers, body and attachments of a .msg attachment.
+
+    depth counts the containers (msg/zip) enclosing this attachment; nested
+    attachments are only opened while it is below MAX_ATTACHMENT_DEPTH.
+    Archives inside the message share budget (a ZipBudget, new if None).
+    """
+    if depth >= MAX_ATTACHMENT_DEPTH:
+        return {
+            'type': 'msg_error',
+            'content': f"Skipped MSG attachment {attachment_name}: nested deeper than {MAX_ATTACHMENT_DEPTH} levels"
+        }
+    budget = budget or ZipBudget()
+    try:
+        # Parse straight from the payload already held in memory
+        msg = message_from_bytes(attachment_content)
 
         content = {
             'type': 'msg',
@@ -68,16 +355,13 @@ def process_msg_attachment(attachment_name, attachment_content):
                         }
                         # Process the nested attachment
                         nested_attachment.update(process_attachment(
-                            nested_attachment_name, nested_attachment_content))
+                            nested_attachment_name, nested_attachment_content, depth + 1, budget))
                         content['attachments'].append(nested_attachment)
         else:
             payload = msg.get_payload(decode=True)
             if payload:
                 content['body'] = payload.decode('utf-8', errors='ignore')
 
-        # Clean up temporary file
-        os.unlink(tmp_path)
-
         return content
     except Exception as e:
         return {
@@ -86,10 +370,170 @@ def process_msg_attachment(attachment_name, attachment_content):
         }
 
 
-def process_attachment(attachment_name, attachment_content):
-    """Processes attachment content and extracts text based on file type."""
-    ext = os.path.splitext(attachment_name)[
-        1].lower() if attachment_name else ''
+def extract_xlsx_text(attachment_content):
+    """Extracts the rows of every sheet in an .xlsx file.
+
+    The workbook is streamed in read-only mode and each sheet is capped at
+    XLSX_MAX_ROWS_PER_SHEET rows and XLSX_MAX_CHARS_PER_SHEET characters;
+    'truncated' is set on the result when a cap was hit.
+    """
+    lines = []
+    truncated = False
+    with io.BytesIO(attachment_content) as file_stream:
+        wb = load_workbook(file_stream, read_only=True)
+        try:
+            for ws in wb.worksheets:
+                lines.append(f"Sheet: {ws.title}")
+                chars = 0
+                for row_number, row in enumerate(ws.iter_rows(values_only=True)):
+                    if row_number >= XLSX_MAX_ROWS_PER_SHEET:
+                        truncated = True
+                        break
+                    line = ", ".join(str(cell) if cell else "" for cell in row)
+                    chars += len(line) + 1
+                    if chars > XLSX_MAX_CHARS_PER_SHEET:
+                        truncated = True
+                        break
+                    lines.append(line)
+        finally:
+            # Read-only workbooks keep the archive open until closed
+            wb.close()
+
+    result = {
+        'type': 'xlsx',
+        'content': "\n".join(lines) + "\n" if lines else ""
+    }
+    if truncated:
+        result['truncated'] = True
+    return result
+
+
+def extract_pdf_text(attachment_content):
+    """Extracts text from the first pages of a PDF.
+
+    Reading stops after PDF_MAX_PAGES pages or once PDF_MAX_CHARS characters
+    have been collected, and 'truncated' is set on the result when anything
+    was left out.
+    """
+    pdf_reader = PdfReader(io.BytesIO(attachment_content))
+    page_count = len(pdf_reader.pages)
+    pages_to_read = min(page_count, PDF_MAX_PAGES) if PDF_MAX_PAGES else page_count
+
+    texts = []
+    chars = 0
+    for page_number in range(pages_to_read):
+        text = pdf_reader.pages[page_number].extract_text()
+        texts.append(text)
+        chars += len(text) + 1
+        if PDF_MAX_CHARS and chars > PDF_MAX_CHARS:
+            break
+
+    content = "\n".join(texts)
+    truncated = len(texts) < page_count
+    if PDF_MAX_CHARS and len(content) > PDF_MAX_CHARS:
+        content = content[:PDF_MAX_CHARS]
+        truncated = True
+
+    result = {
+        'type': 'pdf',
+        'content': content
+    }
+    if truncated:
+        result['truncated'] = True
+    return result
+
+
+def _read_zip_entry(zip_file, zip_info, limit):
+    """Reads a zip entry in blocks, returning None once it grows past limit.
+
+    The sizes in the zip directory can be forged, so the limit is enforced on
+    the bytes actually decompressed.
+    """
+    blocks = []
+    size = 0
+    with zip_file.open(zip_info) as entry:
+        for block in iter(lambda: entry.read(64 * 1024), b""):
+            size += len(block)
+            if size > limit:
+                return None
+            blocks.append(block)
+    return b"".join(blocks)
+
+
+def _entry_text(zip_info, entry_content, result):
+    """Turns the extraction result of a zip entry into searchable text."""
+    if result.get('type') == 'msg':
+        return f"{result.get('subject', '')}\n{result.get('body', '')}"
+    if result.get('type') == 'unsupported':
+        # Unknown extensions are kept as text unless they look binary
+        if b"\x00" in entry_content[:8192]:
+            return f"Binary content in {zip_info.filename}"
+        return entry_content.decode("utf-8", errors="ignore")
+    return result.get('content', '')
+
+
+def extract_zip_text(attachment_name, attachment_content, depth=0, budget=None):
+    """Extracts every entry of a zip archive with the matching typed extractor.
+
+    Entries are decompressed one at a time and dispatched by extension through
+    process_attachment, so PDFs, Office files and images inside the archive
+    are searchable too. Every entry, skipped or not, uses up budget (a
+    ZipBudget shared with the archives nested inside, new if None). Entries
+    breaking the ZIP_MAX_* limits are skipped and the result is flagged
+    'truncated'.
+    """
+    if depth >= MAX_ATTACHMENT_DEPTH:
+        return {
+            'type': 'error',
+            'content': f"Skipped ZIP attachment {attachment_name}: nested deeper than {MAX_ATTACHMENT_DEPTH} levels"
+        }
+
+    budget = budget or ZipBudget()
+    parts = []
+    truncated = False
+    with zipfile.ZipFile(io.BytesIO(attachment_content)) as zip_file:
+        for zip_info in zip_file.infolist():
+            if zip_info.is_dir():
+                continue
+            if budget.entries <= 0:
+                truncated = True
+                break
+            budget.entries -= 1
+
+            ratio = zip_info.file_size / max(zip_info.compress_size, 1)
+            limit = min(ZIP_MAX_ENTRY_BYTES, budget.bytes)
+            if ratio > ZIP_MAX_RATIO:
+                entry_content = None
+                reason = f"compression ratio {ratio:.0f} exceeds {ZIP_MAX_RATIO}"
+            elif zip_info.file_size > limit:
+                entry_content = None
+                reason = f"{zip_info.file_size} bytes exceeds the size budget"
+            else:
+                entry_content = _read_zip_entry(zip_file, zip_info, limit)
+                reason = "uncompressed size exceeds the size budget"
+
+            if entry_content is None:
+                truncated = True
+                parts.append(f"Skipped Zip Entry: {zip_info.filename} ({reason})\n")
+                continue
+
+            budget.bytes -= len(entry_content)
+            result = process_attachment(zip_info.filename, entry_content, depth + 1, budget)
+            parts.append(
+                f"Zip Entry: {zip_info.filename}\n{_entry_text(zip_info, entry_content, result)}\n")
+
+    result = {
+        'type': 'zip',
+        'content': "".join(parts)
+    }
+    if truncated:
+        result['truncated'] = True
+    return result
+
+
+def _extract_attachment(attachment_name, attachment_content, depth=0, budget=None):
+    """Extracts text from attachment content based on file type."""
+    ext = _attachment_extension(attachment_name)
     try:
         if ext in [".txt", ".csv", ".html"]:
             return {
@@ -104,46 +548,18 @@ def process_attachment(attachment_name, attachment_content):
                     'content': "\n".join(paragraph.text for paragraph in doc.paragraphs)
                 }
         elif ext == ".xlsx":
-            with io.BytesIO(attachment_content) as file_stream:
-                wb = load_workbook(file_stream)
-                text = ""
-                for sheet in wb.sheetnames:
-                    ws = wb[sheet]
-                    text += f"Sheet: {sheet}\n"
-                    for row in ws.iter_rows(values_only=True):
-                        text += ", ".join(str(cell)
-                                          if cell else "" for cell in row) + "\n"
-                return {
-                    'type': 'xlsx',
-                    'content': text
-                }
+            return extract_xlsx_text(attachment_content)
         elif ext == ".pdf":
-            pdf_reader = PdfReader(io.BytesIO(attachment_content))
-            return {
-                'type': 'pdf',
-                'content': "\n".join(page.extract_text() for page in pdf_reader.pages)
-            }
+            return extract_pdf_text(attachment_content)
         elif ext in [".jpg", ".png", ".jpeg", ".bmp", ".tiff"]:
             return {
                 'type': 'image',
                 'content': extract_text_from_image(attachment_content)
             }
         elif ext == ".zip":
-            with zipfile.ZipFile(io.BytesIO(attachment_content)) as zip_file:
-                text = ""
-                for zip_info in zip_file.infolist():
-                    with zip_file.open(zip_info) as file:
-                        try:
-                            file_content = file.read().decode("utf-8", errors="ignore")
-                            text += f"Zip Entry: {zip_info.filename}\n{file_content}\n"
-                        except UnicodeDecodeError:
-                            text += f"Binary content in {zip_info.filename}\n"
-                return {
-                    'type': 'zip',
-                    'content': text
-                }
+            return extract_zip_text(attachment_name, attachment_content, depth, budget)
         elif ext == ".msg":
-            return process_msg_attachment(attachment_name, attachment_content)
+            return _extract_msg_attachment(attachment_name, attachment_content, depth, budget)
         else:
             return {
                 'type': 'unsupported',
@@ -156,12 +572,146 @@ def process_attachment(attachment_name, attachment_content):
         }
 
 
+def cache_get(cache_dir, key):
+    """Returns the cached extraction result for key, or None on a miss."""
+    path = os.path.join(cache_dir, f"{key}.json")
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            result = json.load(f)
+        # Refresh the mtime so eviction treats this entry as recently used
+        os.utime(path)
+        return result
+    except (OSError, ValueError):
+        return None
+
+
+def cache_put(cache_dir, key, result, max_bytes=None):
+    """Stores an extraction result atomically and evicts old entries when full."""
+    global _cache_bytes_since_evict
+    max_bytes = max_bytes or ATTACHMENT_CACHE_MAX_BYTES
+    os.makedirs(cache_dir, exist_ok=True)
+    data = json.dumps(result).encode("utf-8")
+    with tempfile.NamedTemporaryFile(dir=cache_dir, suffix=".tmp", delete=False) as tmp:
+        tmp.write(data)
+    os.replace(tmp.name, os.path.join(cache_dir, f"{key}.json"))
+
+    # Only rescan the directory after a tenth of the budget has been written
+    _cache_bytes_since_evict += len(data)
+    if _cache_bytes_since_evict >= max_bytes // 10:
+        evict_cache(cache_dir, max_bytes)
+        _cache_bytes_since_evict = 0
+
+
+def evict_cache(cache_dir, max_bytes):
+    """Deletes least recently used cache entries until the cache fits in max_bytes."""
+    entries = []
+    total = 0
+    with os.scandir(cache_dir) as it:
+        for entry in it:
+            if entry.name.endswith(".json"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+    if total <= max_bytes:
+        return
+
+    # Evict down to 90% so the next few writes do not trigger another scan
+    target = max_bytes * 0.9
+    for _, size, path in sorted(entries):
+        if total <= target:
+            break
+        try:
+            os.unlink(path)
+            total -= size
+        except OSError:
+            pass
+
+
+def _is_cacheable(result):
+    """Whether a result alone is safe to reuse for the same payload."""
+    return result.get("type") not in _UNCACHEABLE_TYPES and not (
+        result.get("type") == "image" and result.get("content", "").startswith("OCR Error"))
+
+
+def _cached_extract(extract, attachment_name, attachment_content, depth, budget=None):
+    """Runs extract through the attachment cache when ATTACHMENT_CACHE_DIR is set.
+
+    A zip or msg is only cached when every attachment extracted inside it was
+    cacheable too: an OCR timeout or an entry cut off by the depth limit
+    anywhere below marks the whole chain as uncacheable. Attachments nested in
+    a container (budget given) depend on what is left of the shared ZipBudget,
+    so only top-level attachments are looked up and stored.
+    """
+    global _extract_uncacheable
+    if not ATTACHMENT_CACHE_DIR:
+        return extract(attachment_name, attachment_content, depth, budget)
+
+    top_level = budget is None
+    # The extension is part of the key since it selects the extractor
+    key = hashlib.sha256(attachment_content).hexdigest() + \
+        _attachment_extension(attachment_name)
+    if top_level:
+        result = cache_get(ATTACHMENT_CACHE_DIR, key)
+        if result is not None:
+            return result
+
+    enclosing_uncacheable, _extract_uncacheable = _extract_uncacheable, False
+    cacheable = False
+    try:
+        result = extract(attachment_name, attachment_content, depth, budget)
+        cacheable = not _extract_uncacheable and _is_cacheable(result)
+    finally:
+        _extract_uncacheable = enclosing_uncacheable or not cacheable
+    if cacheable and top_level:
+        try:
+            cache_put(ATTACHMENT_CACHE_DIR, key, result)
+        except OSError as e:
+            print(f"Could not cache attachment {attachment_name}: {e}")
+    return result
+
+
+def process_msg_attachment(attachment_name, attachment_content, depth=0, budget=None):
+    """Processes .msg attachment and extracts its content."""
+    return _cached_extract(_extract_msg_attachment, attachment_name, attachment_content, depth, budget)
+
+
+def process_attachment(attachment_name, attachment_content, depth=0, budget=None):
+    """Processes attachment content and extracts text based on file type."""
+    return _cached_extract(_extract_attachment, attachment_name, attachment_content, depth, budget)
+
+
+def document_key(file_path):
+    """Returns the 'filename' a file is stored under in MongoDB and the manifest.
+
+    Inside the mailbox folder of the run this is the path relative to it with
+    '/' separators, so same-named files in different subdirectories of a
+    recursive run stay apart; for a flat folder it is just the file name.
+    """
+    if _msg_folder:
+        relative_path = os.path.relpath(file_path, _msg_folder)
+        if relative_path.split(os.sep)[0] != os.pardir:
+            return relative_path.replace(os.sep, "/")
+    return os.path.basename(file_path)
+
+
 def process_email_file(file_path):
-    """Processes a single email file and returns data for MongoDB."""
+    """Processes a single email file and returns data for MongoDB.
+
+    Stage timings for the email are collected in _timings and, when
+    STORE_TIMINGS is set, also returned as its 'timings' sub-document.
+    """
+    global _timings
+    _timings = {}
+    started = time.perf_counter()
     try:
-        filename = os.path.basename(file_path)
+        filename = document_key(file_path)
         with open(file_path, "rb") as eml_file:
-            email_message = message_from_bytes(eml_file.read())
+            with timed("read"):
+                raw_email = eml_file.read()
+            _timings["read"][1] = len(raw_email)
+
+        parse_started = time.perf_counter()
+        email_message = message_from_bytes(raw_email)
 
         # Extract metadata and body
         from_address = email_message["From"] or "Unknown Sender"
@@ -185,6 +735,7 @@ def process_email_file(file_path):
                 body = payload.decode("utf-8", errors="ignore")
 
         body = body or "No Body Content"
+        _record_timing("mime_parse", time.perf_counter() - parse_started, len(raw_email))
 
         # Process attachments
         for attachment in attachments:
@@ -195,12 +746,17 @@ def process_email_file(file_path):
                     "name": attachment_name or "unnamed_attachment",
                     "size": len(attachment_content)
                 }
+                attachment_started = time.perf_counter()
                 processed_attachment.update(process_attachment(
                     attachment_name, attachment_content))
+                _record_timing(f"attachment_{processed_attachment.get('type', 'unknown')}",
+                               time.perf_counter() - attachment_started, len(attachment_content))
                 processed_attachments.append(processed_attachment)
 
+        _record_timing("process_email", time.perf_counter() - started, len(raw_email))
+
         # Return document data
-        return {
+        email_data = {
             "filename": filename,
             "from": from_address,
             "subject": subject,
@@ -210,45 +766,434 @@ def process_email_file(file_path):
             "processing_date": datetime.now(),
             "status": "processed"
         }
+        if STORE_TIMINGS:
+            email_data["timings"] = {stage: round(seconds, 6)
+                                     for stage, (seconds, _) in _timings.items()}
+        return email_data
 
     except Exception as e:
         print(f"Error processing {file_path}: {e}")
         return None
 
 
+def _increment(counter):
+    """Increments a shared multiprocessing.Value counter, if one was provided."""
+    if counter is not None:
+        with counter.get_lock():
+            counter.value += 1
+
+
+def open_manifest(manifest_path):
+    """Opens (and creates if needed) the SQLite manifest used by incremental runs."""
+    conn = sqlite3.connect(manifest_path, timeout=30)
+    # WAL lets every worker process read while another one records a file
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS manifest ("
+        "filename TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, sha256 TEXT, status TEXT)"
+    )
+    conn.commit()
+    return conn
+
+
+def _sha256_file(file_path):
+    """Returns the SHA-256 hex digest of a file, read in 1 MB blocks."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def check_manifest(conn, file_path):
+    """Compares a file with its manifest entry.
+
+    Returns (unchanged, fingerprint). A matching size and mtime is trusted
+    without hashing; otherwise the content hash decides, so a file that was
+    only touched is still skipped. The fingerprint is what record_processed
+    should store once the file has been written to MongoDB.
+    """
+    stat = os.stat(file_path)
+    fingerprint = {
+        "filename": document_key(file_path),
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "sha256": None,
+    }
+    row = conn.execute(
+        "SELECT size, mtime_ns, sha256 FROM manifest WHERE filename = ? AND status = 'processed'",
+        (fingerprint["filename"],)
+    ).fetchone()
+
+    if row and row[0] == stat.st_size and row[1] == stat.st_mtime_ns:
+        fingerprint["sha256"] = row[2]
+        return True, fingerprint
+
+    fingerprint["sha256"] = _sha256_file(file_path)
+    if row and row[0] == stat.st_size and row[2] == fingerprint["sha256"]:
+        record_processed(conn, [fingerprint])
+        return True, fingerprint
+    return False, fingerprint
+
+
+def record_processed(conn, fingerprints):
+    """Marks files as processed in the manifest."""
+    conn.executemany(
+        "INSERT OR REPLACE INTO manifest (filename, size, mtime_ns, sha256, status) "
+        "VALUES (:filename, :size, :mtime_ns, :sha256, 'processed')",
+        fingerprints
+    )
+    conn.commit()
+
+
+def init_worker(connections_opened=None, files_processed=None, manifest_path=None,
+                ocr_semaphore=None, client_factory=None, flush_results=None, msg_folder=None):
+    """Pool initializer that opens one MongoDB client per worker process.
+
+    When manifest_path is given the process also keeps the incremental-mode
+    manifest open for the lifetime of the pool. ocr_semaphore caps how many
+    tesseract processes run at once across all workers. client_factory
+    replaces MongoClient, e.g. with an in-memory stand-in for benchmarks.
+    Emails still buffered by buffered_worker are written when the worker
+    exits, and the outcome is appended to flush_results (a shared list).
+    msg_folder is the mailbox folder documents are keyed relative to.
+    """
+    global _client, _collection, _connections_opened, _files_processed, _manifest, _ocr_semaphore
+    global _flush_results, _msg_folder
+    _msg_folder = msg_folder
+    _connections_opened = connections_opened
+    _files_processed = files_processed
+    _ocr_semaphore = ocr_semaphore
+    _flush_results = flush_results
+
+    _client = (client_factory or MongoClient)(MONGO_CONNECTION_STRING)
+    _collection = _client[DB_NAME][COLLECTION_NAME]
+    _increment(_connections_opened)
+
+    # Close the client when the pool shuts the worker process down
+    multiprocessing.util.Finalize(None, _client.close, exitpriority=10)
+
+    if manifest_path:
+        _manifest = open_manifest(manifest_path)
+        multiprocessing.util.Finalize(None, _manifest.close, exitpriority=10)
+
+    # Higher priority, so the buffer is written before the client and manifest close
+    multiprocessing.util.Finalize(None, _final_flush, exitpriority=20)
+
+
+def get_collection():
+    """Returns the collection for this process, connecting on first use."""
+    if _collection is None:
+        init_worker(_connections_opened, _files_processed,
+                    ocr_semaphore=_ocr_semaphore, msg_folder=_msg_folder)
+    return _collection
+
+
+def _skip_unchanged(file_path):
+    """Returns (skip, fingerprint) for file_path when incremental mode is on."""
+    if _manifest is None:
+        return False, None
+    unchanged, fingerprint = check_manifest(_manifest, file_path)
+    if unchanged:
+        print(f"Skipping unchanged file {file_path}")
+    return unchanged, fingerprint
+
+
 def worker(file_path):
-    """Worker function that handles MongoDB connection for each process."""
+    """Worker function that reuses the process-wide MongoDB connection.
+
+    Returns the email's stage timings, or None if the file was skipped.
+    """
+    timings = None
     try:
-        client = MongoClient(MONGO_CONNECTION_STRING)
-        db = client[DB_NAME]
-        collection = db[COLLECTION_NAME]
+        collection = get_collection()
+
+        skip, fingerprint = _skip_unchanged(file_path)
+        if skip:
+            return None
 
         email_data = process_email_file(file_path)
+        timings = _timings
         if email_data:
             # Update existing document or insert new one
+            upsert_started = time.perf_counter()
             result = collection.update_one(
                 {"filename": email_data["filename"]},
                 {"$set": email_data},
                 upsert=True
             )
+            timings["mongo_upsert"] = [time.perf_counter() - upsert_started, 0]
             if result.upserted_id:
                 print(
                     f"Inserted new document for {file_path} (ID: {result.upserted_id})")
             else:
                 print(f"Updated existing document for {file_path}")
+            if fingerprint:
+                record_processed(_manifest, [fingerprint])
+    except Exception as e:
+        print(f"Error processing {file_path}: {e}")
+    finally:
+        _increment(_files_processed)
+    return timings
+
+
+def flush_batch(collection, batch):
+    """Writes (file_path, email_data) pairs with one unordered bulk_write.
+
+    Reports the outcome of every file in the batch and returns the paths whose
+    upsert failed.
+    """
+    if not batch:
+        return []
+
+    operations = [
+        UpdateOne({"filename": email_data["filename"]},
+                  {"$set": email_data}, upsert=True)
+        for _, email_data in batch
+    ]
+    upserted_ids = {}
+    write_errors = {}
+    try:
+        result = collection.bulk_write(operations, ordered=False)
+        upserted_ids = result.upserted_ids or {}
+    except BulkWriteError as e:
+        # With ordered=False the rest of the batch is still applied
+        upserted_ids = {item["index"]: item["_id"]
+                        for item in e.details.get("upserted", [])}
+        write_errors = {error["index"]: error.get("errmsg", "unknown error")
+                        for error in e.details.get("writeErrors", [])}
+    except Exception as e:
+        write_errors = {index: str(e) for index in range(len(batch))}
+
+    failed = []
+    for index, (file_path, _) in enumerate(batch):
+        if index in write_errors:
+            print(f"Error processing {file_path}: {write_errors[index]}")
+            failed.append(file_path)
+        elif index in upserted_ids:
+            print(
+                f"Inserted new document for {file_path} (ID: {upserted_ids[index]})")
+        else:
+            print(f"Updated existing document for {file_path}")
+    return failed
+
+
+def _flush_pending(collection):
+    """Writes this process's buffered emails and records them in the manifest.
+
+    Returns the failed paths and the duration of the bulk_write, if one ran.
+    """
+    global _pending, _last_flush
+    batch = _pending
+    _last_flush = time.monotonic()
+    if not batch:
+        return [], []
+
+    write_started = time.perf_counter()
+    failed = flush_batch(collection, batch)
+    # Only emptied once written, so a raising write leaves the batch to _drop_pending
+    _pending = []
+    bulk_writes = [time.perf_counter() - write_started]
+    failed_paths = set(failed)
+    written = [_pending_fingerprints.pop(file_path) for file_path, _ in batch
+               if file_path in _pending_fingerprints and file_path not in failed_paths]
+    for file_path in failed_paths:
+        _pending_fingerprints.pop(file_path, None)
+    if written:
+        record_processed(_manifest, written)
+    return failed, bulk_writes
+
+
+def _drop_pending():
+    """Empties this process's buffer after a failed write and returns its paths."""
+    global _pending
+    paths = [file_path for file_path, _ in _pending]
+    _pending = []
+    for file_path in paths:
+        _pending_fingerprints.pop(file_path, None)
+    return paths
+
+
+def buffered_worker(file_path, batch_size=None, flush_interval=None):
+    """Worker function that parses one file into this process's bulk-write buffer.
+
+    The buffer is flushed with one bulk_write once batch_size emails are
+    pending or flush_interval seconds have passed since the last flush; the
+    rest is written when the worker exits. Returns the failed paths, the
+    stage timings of the email and the duration of any bulk_write it ran.
+    """
+    global _last_flush
+    batch_size = batch_size or BULK_BATCH_SIZE
+    flush_interval = BULK_FLUSH_INTERVAL if flush_interval is None else flush_interval
+    if _last_flush is None:
+        _last_flush = time.monotonic()
+    failed = []
+    email_timings = []
+    bulk_writes = []
+
+    # A failure here only concerns this file; the emails already buffered stay queued
+    try:
+        collection = get_collection()
+        skip, fingerprint = _skip_unchanged(file_path)
+        if not skip:
+            email_data = process_email_file(file_path)
+            email_timings.append(_timings)
+            if email_data:
+                _pending.append((file_path, email_data))
+                if fingerprint:
+                    _pending_fingerprints[file_path] = fingerprint
     except Exception as e:
         print(f"Error processing {file_path}: {e}")
+        failed.append(file_path)
+        return {"failed": failed, "timings": email_timings, "bulk_writes": bulk_writes}
     finally:
-        client.close()
+        _increment(_files_processed)
+
+    if len(_pending) >= batch_size or time.monotonic() - _last_flush >= flush_interval:
+        try:
+            failed, bulk_writes = _flush_pending(collection)
+        except Exception as e:
+            print(f"Error writing {len(_pending)} buffered file(s): {e}")
+            failed.extend(_drop_pending())
+    return {"failed": failed, "timings": email_timings, "bulk_writes": bulk_writes}
 
 
-def process_files_in_parallel(msg_folder):
-    """Processes email files in parallel using multiprocessing."""
-    file_paths = [os.path.join(msg_folder, filename) for filename in os.listdir(msg_folder)
-                  if filename.endswith((".eml", ".msg"))]
+def _final_flush():
+    """Writes the emails left in this process's buffer when the worker exits."""
+    if not _pending:
+        return
+    try:
+        failed, bulk_writes = _flush_pending(get_collection())
+    except Exception as e:
+        print(f"Error writing {len(_pending)} buffered file(s): {e}")
+        failed, bulk_writes = _drop_pending(), []
+    if _flush_results is not None:
+        _flush_results.append({"failed": failed, "timings": [], "bulk_writes": bulk_writes})
+
+
+def batch_worker(file_paths, batch_size=None, flush_interval=None):
+    """Upserts a list of files through bulk_write in the calling process.
+
+    Files go through buffered_worker and whatever is still buffered at the end
+    is flushed. Returns the failed paths, the stage timings of every processed
+    email and the duration of each bulk_write.
+    """
+    failed = []
+    email_timings = []
+    bulk_writes = []
+    for file_path in file_paths:
+        result = buffered_worker(file_path, batch_size, flush_interval)
+        failed.extend(result["failed"])
+        email_timings.extend(result["timings"])
+        bulk_writes.extend(result["bulk_writes"])
+
+    try:
+        final_failed, final_bulk_writes = _flush_pending(get_collection())
+    except Exception as e:
+        print(f"Error processing batch of {len(file_paths)} file(s): {e}")
+        final_failed, final_bulk_writes = _drop_pending(), []
+    failed.extend(final_failed)
+    bulk_writes.extend(final_bulk_writes)
+    return {"failed": failed, "timings": email_timings, "bulk_writes": bulk_writes}
+
+
+def iter_email_files(msg_folder, recursive=False):
+    """Yields .eml/.msg paths under msg_folder as os.scandir finds them.
+
+    Nothing is collected up front, so workers can start on the first file
+    straight away and memory stays flat on very large mailbox exports.
+    """
+    pending = [msg_folder]
+    while pending:
+        with os.scandir(pending.pop()) as entries:
+            for entry in entries:
+                if entry.is_file() and entry.name.endswith((".eml", ".msg")):
+                    yield entry.path
+                elif recursive and entry.is_dir(follow_symlinks=False):
+                    pending.append(entry.path)
+
+
+def process_files_in_parallel(msg_folder, pool_size=None, batch_size=None, flush_interval=None,
+                              recursive=False, chunksize=None, incremental=False, manifest_path=None,
+                              ocr_concurrency=None, client_factory=None):
+    """Processes email files in parallel using multiprocessing.
+
+    Each worker process opens a single MongoDB client in init_worker and reuses
+    it for every file it handles. Paths are streamed from iter_email_files into
+    Pool.imap_unordered, chunksize at a time, and stored under their path
+    relative to msg_folder (see document_key). When batch_size is given, each
+    worker buffers the emails it parses in buffered_worker and upserts them
+    with bulk_write, batch_size at a time, instead of one update_one per file.
+    With incremental=True, files whose size/mtime or content hash match the
+    manifest at manifest_path are skipped. Returns the number of connections
+    opened and files processed so the connection reuse can be checked. ocr_concurrency limits the number of tesseract
+    processes running at the same time across the whole pool. Per-stage
+    latency percentiles and throughput are printed at the end of the run and
+    returned under 'timings'.
+    """
+    file_paths = iter_email_files(msg_folder, recursive=recursive)
+
+    if incremental:
+        manifest_path = manifest_path or MANIFEST_PATH
+        # Create the table once here rather than racing on it in every worker
+        open_manifest(manifest_path).close()
+    else:
+        manifest_path = None
+
+    connections_opened = multiprocessing.Value("i", 0)
+    files_processed = multiprocessing.Value("i", 0)
+    ingestion_stats = IngestionStats()
+    ocr_semaphore = multiprocessing.BoundedSemaphore(
+        ocr_concurrency) if ocr_concurrency else None
+    failed = []
+    chunksize = chunksize or IMAP_CHUNKSIZE
+    # Outcome of the flush every worker runs on exit; only needed in bulk-write mode
+    manager = multiprocessing.Manager() if batch_size else None
+    flush_results = manager.list() if manager else None
+
+    def add_batch_result(batch_result):
+        failed.extend(batch_result["failed"])
+        for timings in batch_result["timings"]:
+            ingestion_stats.add_email(timings)
+        for seconds in batch_result["bulk_writes"]:
+            ingestion_stats.add_stage("mongo_bulk_write", seconds)
+
+    try:
+        with multiprocessing.Pool(processes=pool_size or POOL_SIZE,
+                                  initializer=init_worker,
+                                  initargs=(connections_opened, files_processed, manifest_path,
+                                            ocr_semaphore, client_factory, flush_results,
+                                            msg_folder)) as pool:
+            if batch_size:
+                task = partial(buffered_worker, batch_size=batch_size,
+                               flush_interval=flush_interval)
+                for batch_result in pool.imap_unordered(task, file_paths, chunksize=chunksize):
+                    add_batch_result(batch_result)
+            else:
+                for timings in pool.imap_unordered(worker, file_paths, chunksize=chunksize):
+                    ingestion_stats.add_email(timings)
+            # Let workers exit cleanly so they flush and close their MongoDB clients
+            pool.close()
+            pool.join()
+        if manager:
+            for batch_result in list(flush_results):
+                add_batch_result(batch_result)
+    finally:
+        if manager:
+            manager.shutdown()
 
-    with multiprocessing.Pool(processes=multiprocessing.cpu_count()) as pool:
-        pool.map(worker, file_paths)
+    stats = {
+        "connections_opened": connections_opened.value,
+        "files_processed": files_processed.value,
+    }
+    print(
+        f"Opened {stats['connections_opened']} MongoDB connection(s) for {stats['files_processed']} file(s)")
+    if batch_size:
+        stats["failed_files"] = failed
+        print(f"{len(failed)} file(s) failed to be written")
+    stats["timings"] = ingestion_stats.print_summary()
+    return stats
 
 
 def ensure_db_and_collection(uri, db_name, collection_name):
@@ -267,4 +1212,5 @@ if __name__ == "__main__":
     print(f"Message Folder Path: {msg_folder_path}")
     print("Starting email processing...")
     ensure_db_and_collection(MONGO_CONNECTION_STRING, DB_NAME, COLLECTION_NAME)
-    process_files_in_parallel(msg_folder_path)
+    # Only new or changed files are parsed; delete the manifest to force a full run
+    process_files_in_parallel(msg_folder_path, incremental=True)
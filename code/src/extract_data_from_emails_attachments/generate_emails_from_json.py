@@ -1,92 +1,204 @@
+import base64
 import json
+import multiprocessing
 import os
 from datetime import datetime
-from email import encoders
 from email.mime.base import MIMEBase
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 
+# Characters of the JSON dataset read per step while streaming it
+JSON_READ_SIZE = 1024 * 1024
 
-def create_email_from_json_file(json_file_path, attachment_folder, output_folder):
+# Email records handed to each writer process per task
+WRITER_CHUNKSIZE = 64
+
+# Per-process cache of base64-encoded attachments: {path: encoded payload or None}
+_attachment_cache = {}
+
+# (attachment_folder, output_folder) of a writer process
+_writer_folders = None
+
+
+def iter_json_array(json_file_path, read_size=None):
+    """
+    Yields the items of a top-level JSON array one at a time.
+
+    The file is read in blocks of read_size characters, so only the item being
+    decoded is held in memory rather than the whole dataset.
+    """
+    read_size = read_size or JSON_READ_SIZE
+    decoder = json.JSONDecoder()
+    with open(json_file_path, "r", encoding="utf-8") as json_file:
+        buffer = ""
+        position = 0
+        started = False
+        eof = False
+        while True:
+            # Skip whitespace and separators between items
+            while position < len(buffer) and buffer[position] in " \t\r\n,":
+                position += 1
+
+            if position < len(buffer):
+                if not started:
+                    if buffer[position] != "[":
+                        raise ValueError(
+                            f"{json_file_path} does not contain a JSON array")
+                    started = True
+                    position += 1
+                    continue
+                if buffer[position] == "]":
+                    return
+                try:
+                    item, end = decoder.raw_decode(buffer, position)
+                    # A number cut off by the end of the buffer still decodes,
+                    # so the item is only complete once the character after it is read
+                    if end < len(buffer) or eof:
+                        yield item
+                        position = end
+                        continue
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+
+            if eof:
+                if started:
+                    raise ValueError(f"Unexpected end of JSON array in {json_file_path}")
+                return
+
+            # Need more data: drop what has been consumed and read the next block
+            buffer = buffer[position:]
+            position = 0
+            block = json_file.read(read_size)
+            if block:
+                buffer += block
+            else:
+                eof = True
+
+
+def _encoded_attachment(attachment_path):
+    """Returns the base64 payload of an attachment, reading each file only once."""
+    if attachment_path not in _attachment_cache:
+        if os.path.exists(attachment_path):
+            with open(attachment_path, "rb") as attachment_file:
+                # Same encoding as email.encoders.encode_base64
+                _attachment_cache[attachment_path] = base64.encodebytes(
+                    attachment_file.read()).decode("ascii")
+        else:
+            _attachment_cache[attachment_path] = None
+    return _attachment_cache[attachment_path]
+
+
+def build_email(email_data, attachment_folder):
+    """
+    Builds the MIME message for one email record.
+
+    Args:
+        email_data (dict): Email details from the JSON dataset.
+        attachment_folder (str): Path to the folder containing attachment files.
+    """
+    msg = MIMEMultipart()
+    msg['From'] = f"{email_data['sender']} <{email_data['sender_email']}>"
+    msg['To'] = "support@company.com"
+    msg['Subject'] = email_data["subject"]
+    msg['Date'] = datetime.strptime(
+        email_data["received_at"], "%Y-%m-%dT%H:%M:%S.%f").strftime("%a, %d %b %Y %H:%M:%S")
+
+    # Add email body
+    msg.attach(MIMEText(email_data["body"], 'plain'))
+
+    # Attach files if available
+    for attachment_name in email_data.get("attachments", []):
+        attachment_path = os.path.join(attachment_folder, attachment_name)
+        payload = _encoded_attachment(attachment_path)
+        if payload is None:
+            print(f"Attachment not found: {attachment_path}")
+            continue
+        part = MIMEBase("application", "octet-stream")
+        # Already base64-encoded, so only the header is needed
+        part.set_payload(payload)
+        part["Content-Transfer-Encoding"] = "base64"
+        part.add_header(
+            "Content-Disposition",
+            f"attachment; filename={attachment_name}",
+        )
+        msg.attach(part)
+    return msg
+
+
+def write_email_files(email_data, attachment_folder, output_folder):
+    """Writes the .eml for one email record, plus its duplicate if flagged."""
+    email_id = email_data["email_id"]
+    email_text = build_email(email_data, attachment_folder).as_string()
+
+    output_filenames = [f"{email_id}.eml"]
+    # Generate duplicate email if needed
+    if email_data["is_duplicate"]:
+        output_filenames.append(f"{email_id}_DUPLICATE.eml")
+
+    for output_filename in output_filenames:
+        # Save the email as .eml
+        email_path = os.path.join(output_folder, output_filename)
+        with open(email_path, "w", encoding="utf-8") as eml_file:
+            eml_file.write(email_text)
+        print(f"Generated email: {email_path}")
+    return len(output_filenames)
+
+
+def _init_writer(attachment_folder, output_folder):
+    """Pool initializer that stores the folders used by _write_email_task."""
+    global _writer_folders
+    _writer_folders = (attachment_folder, output_folder)
+
+
+def _write_email_task(email_data):
+    return write_email_files(email_data, *_writer_folders)
+
+
+def create_email_from_json_file(json_file_path, attachment_folder, output_folder, processes=1,
+                                chunksize=None):
     """
     Reads email content from a JSON file and generates emails based on the data.
 
+    The dataset is streamed record by record. With processes > 1 the records
+    are built and written by a pool of writer processes, each of which reads
+    and base64-encodes every attachment file at most once.
+
     Args:
         json_file_path (str): Path to the JSON file containing email details.
         attachment_folder (str): Path to the folder containing attachment files.
         output_folder (str): Path to the folder where .eml files will be saved.
+        processes (int): Number of writer processes.
+        chunksize (int): Email records handed to a writer process per task.
+
+    Returns:
+        int: Number of .eml files written.
     """
     os.makedirs(output_folder, exist_ok=True)
 
-    # Load email data from the JSON file
-    with open(json_file_path, "r", encoding="utf-8") as json_file:
-        # Assume the file contains a list of email objects
-        email_data_list = json.load(json_file)
-
-    for email_data in email_data_list:
-        # Unpack email data
-        email_id = email_data["email_id"]
-        sender = email_data["sender"]
-        sender_email = email_data["sender_email"]
-        subject = email_data["subject"]
-        body = email_data["body"]
-        attachments = email_data.get("attachments", [])
-        received_at = email_data["received_at"]
-        is_duplicate = email_data["is_duplicate"]
-
-        # Create email
-        def generate_email(output_filename, is_duplicate=False):
-            msg = MIMEMultipart()
-            msg['From'] = f"{sender} <{sender_email}>"
-            msg['To'] = "support@company.com"
-            msg['Subject'] = subject
-            msg['Date'] = datetime.strptime(
-                received_at, "%Y-%m-%dT%H:%M:%S.%f").strftime("%a, %d %b %Y %H:%M:%S")
-
-            # Add email body
-            msg.attach(MIMEText(body, 'plain'))
-
-            # Attach files if available
-            for attachment_name in attachments:
-                attachment_path = os.path.join(
-                    attachment_folder, attachment_name)
-                if os.path.exists(attachment_path):
-                    with open(attachment_path, "rb") as attachment_file:
-                        part = MIMEBase("application", "octet-stream")
-                        part.set_payload(attachment_file.read())
-                        encoders.encode_base64(part)
-                        part.add_header(
-                            "Content-Disposition",
-                            f"attachment; filename={attachment_name}",
-                        )
-                        msg.attach(part)
-                else:
-                    print(f"Attachment not found: {attachment_path}")
-
-            # Save the email as .eml
-            email_path = os.path.join(output_folder, output_filename)
-            with open(email_path, "w", encoding="utf-8") as eml_file:
-                eml_file.write(msg.as_string())
-
-            print(f"Generated email: {email_path}")
-
-        # Generate primary email
-        generate_email(f"{email_id}.eml")
-
-        # Generate duplicate email if needed
-        if is_duplicate:
-            duplicate_email_id = f"{email_id}_DUPLICATE"
-            generate_email(f"{duplicate_email_id}.eml", is_duplicate=True)
-
-
-# Example Usage:
-BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__)))
-RESOURCES_DIR = os.path.join(BASE_DIR, "resources")
-json_file_path = os.path.join(RESOURCES_DIR, 'email_datasets.json')
-attachment_folder_path = os.path.join(
-    RESOURCES_DIR, 'attachments')  # Folder containing attachments
-# Folder to save generated emails
-output_folder_path = os.path.join(RESOURCES_DIR, 'emails')
-
-create_email_from_json_file(
-    json_file_path, attachment_folder_path, output_folder_path)
+    # Assume the file contains a list of email objects
+    email_data_iter = iter_json_array(json_file_path)
+
+    if processes and processes > 1:
+        with multiprocessing.Pool(processes=processes, initializer=_init_writer,
+                                  initargs=(attachment_folder, output_folder)) as pool:
+            return sum(pool.imap_unordered(_write_email_task, email_data_iter,
+                                           chunksize=chunksize or WRITER_CHUNKSIZE))
+
+    return sum(write_email_files(email_data, attachment_folder, output_folder)
+               for email_data in email_data_iter)
+
+
+if __name__ == "__main__":
+    # Example Usage:
+    BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__)))
+    RESOURCES_DIR = os.path.join(BASE_DIR, "resources")
+    json_file_path = os.path.join(RESOURCES_DIR, 'email_datasets.json')
+    attachment_folder_path = os.path.join(
+        RESOURCES_DIR, 'attachments')  # Folder containing attachments
+    # Folder to save generated emails
+    output_folder_path = os.path.join(RESOURCES_DIR, 'emails')
+
+    create_email_from_json_file(
+        json_file_path, attachment_folder_path, output_folder_path,
+        processes=multiprocessing.cpu_count())
@@ -1,7 +1,22 @@
 import torch
 import torch.nn.functional as F
 from transformers import AutoTokenizer, AutoModelForSequenceClassification
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Sequence, Tuple
+
+# Number of emails classified per forward pass by classify_emails
+BATCH_SIZE = 16
+
+# Token attribution stored with each prediction:
+#   "off"  - no attention analysis (important_tokens is an empty list)
+#   "topk" - the ATTRIBUTION_TOP_K tokens [CLS] attends to most, ignoring
+#            padding and special tokens
+#   "full" - every token, sorted by attention score
+ATTRIBUTION_MODE = "topk"
+ATTRIBUTION_TOP_K = 10
+ATTRIBUTION_MODES = ("off", "topk", "full")
+
+# Model output class id -> label
+label_mapping = {0: "update", 1: "request"}
 
 # Define taxonomy-related keywords (you can expand this)
 taxonomy_keywords = {
@@ -14,12 +29,18 @@ def classify_email(
     model: AutoModelForSequenceClassification,
     tokenizer: AutoTokenizer,
     max_length: int = 128,
+    attribution: str = None,
+    top_k: int = None,
 ) -> tuple[str, float, List[Dict[str, Any]]]:
     """
     Tokenizes the input text, performs inference using the model,
     and returns the predicted label, confidence score, and
     an analysis of token contributions based on attention weights.
+
+    attribution ("off", "topk" or "full") and top_k default to
+    ATTRIBUTION_MODE and ATTRIBUTION_TOP_K.
     """
+    attribution = _attribution_mode(attribution)
     inputs = tokenizer(
         email_text,
         return_tensors="pt",
@@ -35,7 +56,8 @@ def classify_email(
 
     with torch.no_grad():
         outputs = model(
-            input_ids=input_ids, attention_mask=attention_mask, output_attentions=True # Crucial: Get attention weights
+            input_ids=input_ids, attention_mask=attention_mask,
+            output_attentions=attribution != "off",  # Attention weights are only needed for attribution
         )  # Pass only model inputs
 
     logits = outputs.logits
@@ -44,9 +66,11 @@ def classify_email(
     confidence_score = probabilities[predicted_class_id].item()
 
     # Map model output to a label.
-    label_mapping = {0: "update", 1: "request"}
     predicted_label = label_mapping[predicted_class_id]
 
+    if attribution == "off":
+        return predicted_label, confidence_score, []
+
     # Attention-based token analysis
     attention_weights = outputs.attentions  # This is a tuple of attention tensors
     
@@ -64,8 +88,77 @@ def classify_email(
     offset_mapping = inputs["offset_mapping"][0]
     input_ids = input_ids[0]  # Get the first (and only) sequence
 
+    if attribution == "topk":
+        scores, positions = _top_k_attention(
+            cls_attention.unsqueeze(0), inputs["input_ids"], attention_mask, tokenizer, top_k
+        )
+        important_tokens = _token_analysis(
+            email_text, input_ids, offset_mapping, scores[0], predicted_label, tokenizer, positions[0]
+        )
+    else:
+        important_tokens = _token_analysis(
+            email_text, input_ids, offset_mapping, cls_attention, predicted_label, tokenizer
+        )
+
+    return predicted_label, confidence_score, important_tokens
+
+
+def _attribution_mode(attribution: str = None) -> str:
+    attribution = attribution or ATTRIBUTION_MODE
+    if attribution not in ATTRIBUTION_MODES:
+        raise ValueError(f"Unknown attribution mode {attribution!r}, expected one of {ATTRIBUTION_MODES}")
+    return attribution
+
+
+def _top_k_attention(
+    cls_attention: torch.Tensor,
+    input_ids: torch.Tensor,
+    attention_mask: torch.Tensor,
+    tokenizer: AutoTokenizer,
+    top_k: int = None,
+) -> Tuple[torch.Tensor, torch.Tensor]:
+    """
+    Selects the top_k tokens of every sequence by [CLS] attention.
+
+    cls_attention, input_ids and attention_mask have shape [batch_size, seq_len].
+    Padding and special tokens are masked out before torch.topk, so rows with
+    fewer candidate tokens than top_k end with -inf scores.
+    Returns (scores, positions), both of shape [batch_size, k].
+    """
+    top_k = top_k or ATTRIBUTION_TOP_K
+    candidates = attention_mask.bool() & ~torch.isin(
+        input_ids, torch.tensor(tokenizer.all_special_ids, dtype=input_ids.dtype)
+    )
+    masked_attention = cls_attention.masked_fill(~candidates, float("-inf"))
+    return torch.topk(masked_attention, k=min(top_k, masked_attention.shape[-1]), dim=-1)
+
+
+def _token_analysis(
+    email_text: str,
+    input_ids: Sequence[int],
+    offset_mapping: Sequence[Tuple[int, int]],
+    cls_attention: torch.Tensor,
+    predicted_label: str,
+    tokenizer: AutoTokenizer,
+    positions: torch.Tensor = None,
+) -> List[Dict[str, Any]]:
+    """
+    Pairs tokens with the attention they receive from [CLS], sorted by
+    attention score (descending).
+
+    With positions, cls_attention holds the scores of those token positions
+    only (as returned by _top_k_attention) and masked -inf entries are skipped.
+    Otherwise every token is included.
+    """
+    if positions is None:
+        positions = range(len(cls_attention))
+    else:
+        positions = positions.tolist()
+
     important_tokens: List[Dict[str, Any]] = []
-    for i, attention_score in enumerate(cls_attention):
+    for i, attention_score in zip(positions, cls_attention.tolist()):
+        if attention_score == float("-inf"):
+            continue
         start, end = offset_mapping[i]
         word = email_text[start:end]
         token = tokenizer.decode([input_ids[i]])
@@ -78,11 +171,105 @@ def classify_email(
         important_tokens.append({
             "token": token,
             "word": word,
-            "attention_score": attention_score.item(),  # Convert to float
+            "attention_score": attention_score,
             "is_taxonomy_word": is_taxonomy_word,
         })
     
     # Sort tokens by attention score (descending)
     important_tokens.sort(key=lambda x: x["attention_score"], reverse=True)
+    return important_tokens
+
+
+def classify_emails(
+    email_texts: Sequence[str],
+    model: AutoModelForSequenceClassification,
+    tokenizer: AutoTokenizer,
+    max_length: int = 128,
+    batch_size: int = BATCH_SIZE,
+    attribution: str = None,
+    top_k: int = None,
+) -> List[Tuple[str, float, List[Dict[str, Any]]]]:
+    """
+    Batched version of classify_email.
+
+    The texts are tokenized once without padding and sorted by token length,
+    so each micro-batch is only padded to its longest item and runs as a
+    single forward pass. Returns one (label, confidence, important_tokens)
+    tuple per text, in input order. Padding positions are not included in
+    important_tokens. attribution and top_k work as in classify_email.
+    """
+    attribution = _attribution_mode(attribution)
+    email_texts = list(email_texts)
+    if not email_texts:
+        return []
+
+    encodings = tokenizer(
+        email_texts,
+        truncation=True,
+        max_length=max_length,
+        return_offsets_mapping=True,
+    )
+    all_input_ids = encodings["input_ids"]
+    order = sorted(range(len(email_texts)), key=lambda i: len(all_input_ids[i]))
+
+    results: List[Tuple[str, float, List[Dict[str, Any]]]] = [None] * len(email_texts)
+    for batch_start in range(0, len(order), batch_size):
+        batch_indices = order[batch_start:batch_start + batch_size]
+        batch = tokenizer.pad(
+            {
+                "input_ids": [all_input_ids[i] for i in batch_indices],
+                "attention_mask": [encodings["attention_mask"][i] for i in batch_indices],
+            },
+            padding=True,
+            return_tensors="pt",
+        )
+
+        with torch.no_grad():
+            outputs = model(
+                input_ids=batch["input_ids"], attention_mask=batch["attention_mask"],
+                output_attentions=attribution != "off",
+            )
+
+        probabilities = F.softmax(outputs.logits, dim=1)
+        predicted_class_ids = outputs.logits.argmax(dim=1)
+
+        if attribution != "off":
+            # Last layer, averaged across heads, as received by [CLS]: [batch_size, seq_len]
+            cls_attention = torch.mean(outputs.attentions[-1], dim=1)[:, 0]
+        if attribution == "topk":
+            top_scores, top_positions = _top_k_attention(
+                cls_attention, batch["input_ids"], batch["attention_mask"], tokenizer, top_k
+            )
+
+        for row, index in enumerate(batch_indices):
+            predicted_class_id = predicted_class_ids[row].item()
+            predicted_label = label_mapping[predicted_class_id]
+            if attribution == "off":
+                important_tokens = []
+            elif attribution == "topk":
+                important_tokens = _token_analysis(
+                    email_texts[index],
+                    all_input_ids[index],
+                    encodings["offset_mapping"][index],
+                    top_scores[row],
+                    predicted_label,
+                    tokenizer,
+                    top_positions[row],
+                )
+            else:
+                seq_len = len(all_input_ids[index])
+                important_tokens = _token_analysis(
+                    email_texts[index],
+                    all_input_ids[index],
+                    encodings["offset_mapping"][index],
+                    cls_attention[row, :seq_len],
+                    predicted_label,
+                    tokenizer,
+                )
+            results[index] = (
+                predicted_label,
+                probabilities[row, predicted_class_id].item(),
+                important_tokens,
+            )
 
-    return predicted_label, confidence_score, important_tokens
\ No newline at end of file
+    return results
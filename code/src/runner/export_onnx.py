@@ -0,0 +1,94 @@
+import os
+import time
+
+from datasets import Dataset
+from pymongo import MongoClient
+
+from model_loader import ONNX_MODEL_FILE, export_onnx_model, load_model
+from email_classifier import classify_emails, label_mapping
+
+MODEL_PATH = "email_classifier_llm_latest"
+
+# Training collection and split, as used by train/data_access.py and train/data_loader.py
+EVAL_MONGO_URI = "mongodb://localhost:27017"
+EVAL_DB_NAME = "email_train_db3"
+EVAL_COLLECTION_NAME = "emails_train3"
+EVAL_TEST_SIZE = 0.2
+EVAL_SEED = 42
+
+# Minimum share of eval predictions a backend must agree on with the PyTorch model
+MIN_AGREEMENT = 0.99
+
+
+def load_eval_split():
+    """
+    Rebuilds the evaluation split of training: the same texts, labels and
+    train_test_split seed as train/data_processing.py and train/data_loader.py.
+    """
+    client = MongoClient(EVAL_MONGO_URI)
+    try:
+        emails = list(client[EVAL_DB_NAME][EVAL_COLLECTION_NAME].find({}))
+    finally:
+        client.close()
+
+    texts, labels = [], []
+    for email in emails:
+        subject = email.get("subject", "").strip()
+        body = email.get("body", "").strip()
+        texts.append(f"{subject} {body}".strip())
+        # "update" (0) if is_update_case, "request" (1) otherwise
+        labels.append(0 if email.get("is_update_case", False) else 1)
+
+    dataset = Dataset.from_dict({"text": texts, "label": labels})
+    eval_dataset = dataset.train_test_split(test_size=EVAL_TEST_SIZE, seed=EVAL_SEED)["test"]
+    return eval_dataset["text"], eval_dataset["label"]
+
+
+def check_parity(texts, labels, reference_model, tokenizer, backends):
+    """
+    Classifies the eval split with every backend and compares accuracy and
+    agreement with the PyTorch reference model.
+
+    Returns True when every backend agrees on at least MIN_AGREEMENT of the
+    predictions.
+    """
+    expected_labels = [label_mapping[label] for label in labels]
+
+    def run(model):
+        started = time.perf_counter()
+        predictions = [label for label, _, _ in classify_emails(texts, model, tokenizer, attribution="off")]
+        return predictions, time.perf_counter() - started
+
+    reference, reference_seconds = run(reference_model)
+    reference_accuracy = sum(p == e for p, e in zip(reference, expected_labels)) / len(texts)
+    print(f"pytorch    accuracy {reference_accuracy:.4f}  {reference_seconds:.2f}s")
+
+    passed = True
+    for name, model in backends.items():
+        predictions, seconds = run(model)
+        accuracy = sum(p == e for p, e in zip(predictions, expected_labels)) / len(texts)
+        agreement = sum(p == r for p, r in zip(predictions, reference)) / len(texts)
+        print(f"{name:<10} accuracy {accuracy:.4f}  {seconds:.2f}s  agreement with pytorch {agreement:.4f}")
+        passed = passed and agreement >= MIN_AGREEMENT
+    return passed
+
+
+def main():
+    model, tokenizer = load_model(MODEL_PATH, backend="pytorch")
+    onnx_path = os.path.join(MODEL_PATH, ONNX_MODEL_FILE)
+    export_onnx_model(model, tokenizer, onnx_path)
+    print(f"Exported {onnx_path}")
+
+    texts, labels = load_eval_split()
+    print(f"Checking parity on {len(texts)} eval emails")
+    backends = {
+        "quantized": load_model(MODEL_PATH, backend="quantized")[0],
+        "onnx": load_model(MODEL_PATH, backend="onnx")[0],
+    }
+    if not check_parity(texts, labels, model, tokenizer, backends):
+        raise SystemExit(f"A backend agrees with pytorch on fewer than {MIN_AGREEMENT:.0%} of eval emails")
+    print("All backends match the PyTorch model.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,38 +1,228 @@
-from model_loader import load_model
-from email_classifier import classify_email
-from mongodb_handler import connect_to_mongodb, update_email_document
+import multiprocessing
+import os
+from itertools import islice
 
-def main():
-    # Load model and tokenizer
-    model, tokenizer = load_model()
+import torch
 
-    # Connect to MongoDB
-    collection = connect_to_mongodb()
+from model_loader import get_model_version, load_model
+from email_classifier import classify_emails
+from mongodb_handler import PredictionWriter, connect_to_mongodb
 
-    # Iterate over each email document.
-    for doc in collection.find():
-        subject = doc.get("subject", "")
-        body = doc.get("body", "")
-        # Combine subject and body to create the text input.
-        email_text = f"{subject} {body}"
+# Number of documents read from MongoDB and classified together. classify_emails
+# sorts each chunk by token length before splitting it into micro-batches.
+DOCUMENT_CHUNK_SIZE = 256
 
-        # Classify the email.
-        predicted_label, confidence_score, important_tokens = classify_email(
-            email_text, model, tokenizer
-        )
+# Torch intra-op threads of each shard process
+TORCH_THREADS_PER_SHARD = 2
+# Worker processes of the sharded runner, each with its own model copy;
+# 1 classifies in this process without sharding
+NUM_SHARDS = max(1, (os.cpu_count() or 1) // TORCH_THREADS_PER_SHARD)
+
+# Side collection (in the same database) holding the progress of every shard
+CHECKPOINT_COLLECTION = "classification_checkpoints"
+
+# Only classify documents without a prediction, or predicted by another model version
+INCREMENTAL = True
+# Fields read from MongoDB for classification
+PROJECTION = {"subject": 1, "body": 1}
+
+
+def pending_query(model_version, incremental=None):
+    """
+    Filter for the documents to classify: in incremental mode, those missing
+    a prediction or whose model_version differs from the loaded model.
+    """
+    if not (INCREMENTAL if incremental is None else incremental):
+        return {}
+    return {"$or": [
+        {"predicted_label": {"$exists": False}},
+        {"confidence_score": {"$exists": False}},
+        # Also matches documents without a model_version
+        {"model_version": {"$ne": model_version}},
+    ]}
+
+
+def classify_chunk(writer, docs, model, tokenizer, model_version=None):
+    """Classifies a chunk of documents and queues the predictions on the PredictionWriter."""
+    # Combine subject and body to create the text input.
+    email_texts = [f"{doc.get('subject', '')} {doc.get('body', '')}" for doc in docs]
+
+    # Classify the emails.
+    results = classify_emails(email_texts, model, tokenizer)
 
+    for doc, (predicted_label, confidence_score, important_tokens) in zip(docs, results):
         # Update the document with the predicted label and confidence score.
-        update_email_document(
-            collection, doc["_id"], predicted_label, confidence_score, important_tokens
-        )
+        writer.add(doc["_id"], predicted_label, confidence_score, important_tokens, model_version)
 
         print(
-            f"Updated document {doc['_id']} with predicted label: {predicted_label}, "
+            f"Classified document {doc['_id']} with predicted label: {predicted_label}, "
             f"confidence score: {confidence_score:.2f}, Important Tokens: {important_tokens}"
         )
 
+
+def compute_shard_ranges(collection, num_shards, query=None):
+    """
+    Splits the documents matching query into at most num_shards contiguous
+    _id ranges of similar size with $bucketAuto.
+
+    Returns a list of (lower, upper, last) tuples: a shard covers
+    lower <= _id < upper, or lower <= _id <= upper for the last one.
+    """
+    buckets = list(collection.aggregate([
+        {"$match": query or {}},
+        {"$bucketAuto": {"groupBy": "$_id", "buckets": num_shards}},
+    ]))
+    return [
+        (bucket["_id"]["min"], bucket["_id"]["max"], index == len(buckets) - 1)
+        for index, bucket in enumerate(buckets)
+    ]
+
+
+def _checkpoint_key(collection, shard_id):
+    return f"{collection.full_name}:{shard_id}"
+
+
+def plan_shards(collection, checkpoints, num_shards, query=None):
+    """
+    Returns the shard ranges to run.
+
+    When the previous run left unfinished shards, their stored ranges are
+    returned so the run resumes; otherwise the collection is split anew and
+    fresh checkpoints are written.
+    """
+    previous = list(checkpoints.find({"collection": collection.full_name}).sort("shard_id", 1))
+    if previous and not all(checkpoint.get("done") for checkpoint in previous):
+        print(f"Resuming {len(previous)} shard(s) from checkpoints.")
+        return [(c["lower"], c["upper"], c["last"]) for c in previous]
+
+    checkpoints.delete_many({"collection": collection.full_name})
+    shard_ranges = compute_shard_ranges(collection, num_shards, query)
+    for shard_id, (lower, upper, last) in enumerate(shard_ranges):
+        checkpoints.insert_one({
+            "_id": _checkpoint_key(collection, shard_id),
+            "collection": collection.full_name,
+            "shard_id": shard_id,
+            "lower": lower,
+            "upper": upper,
+            "last": last,
+            "last_id": None,
+            "done": False,
+        })
+    return shard_ranges
+
+
+def classify_shard(shard_id, lower, upper, last, threads=None, model_version=None):
+    """
+    Classifies the pending documents of one _id range in ascending _id order.
+
+    The last classified _id is saved to CHECKPOINT_COLLECTION after every
+    chunk, so a restarted shard continues after it.
+    """
+    collection = connect_to_mongodb()
+    checkpoints = collection.database[CHECKPOINT_COLLECTION]
+    key = _checkpoint_key(collection, shard_id)
+
+    checkpoint = checkpoints.find_one({"_id": key}) or {}
+    if checkpoint.get("done"):
+        return
+    last_id = checkpoint.get("last_id")
+
+    torch.set_num_threads(threads or TORCH_THREADS_PER_SHARD)
+    model, tokenizer = load_model()
+    model_version = model_version or get_model_version()
+    query = pending_query(model_version)
+
+    id_range = {"$lte" if last else "$lt": upper}
+    classified = 0
+    writer = PredictionWriter(collection)
+    while True:
+        id_filter = dict(id_range)
+        if last_id is None:
+            id_filter["$gte"] = lower
+        else:
+            id_filter["$gt"] = last_id
+        # A new query per chunk, so no cursor stays open during inference
+        shard_query = {"$and": [{"_id": id_filter}, query]} if query else {"_id": id_filter}
+        docs = list(collection.find(shard_query, PROJECTION).sort("_id", 1).limit(DOCUMENT_CHUNK_SIZE))
+        if not docs:
+            break
+
+        classify_chunk(writer, docs, model, tokenizer, model_version)
+        # Predictions are written before the checkpoint moves past them
+        writer.flush()
+        last_id = docs[-1]["_id"]
+        classified += len(docs)
+        checkpoints.update_one({"_id": key}, {"$set": {"last_id": last_id}})
+
+    checkpoints.update_one({"_id": key}, {"$set": {"done": True}})
+    print(f"Shard {shard_id} classified {classified} document(s).")
+    report_writes(writer.close())
+
+
+def report_writes(totals):
+    print(f"Matched {totals['matched_count']} document(s), modified {totals['modified_count']}.")
+    if totals["failed_ids"]:
+        # Failed documents keep no current prediction, so the next run retries them
+        print(f"Failed to update {len(totals['failed_ids'])} document(s): {totals['failed_ids']}")
+
+
+def run_sharded(num_shards=None, threads_per_shard=None):
+    """
+    Classifies the collection with one process per _id range and returns
+    the ids of the shards that failed.
+    """
+    model_version = get_model_version()
+    collection = connect_to_mongodb()
+    checkpoints = collection.database[CHECKPOINT_COLLECTION]
+    shard_ranges = plan_shards(collection, checkpoints, num_shards or NUM_SHARDS,
+                               pending_query(model_version))
+    # Shards open their own connections; MongoClient is not fork-safe
+    collection.database.client.close()
+
+    processes = [
+        multiprocessing.Process(
+            target=classify_shard,
+            args=(shard_id, lower, upper, last, threads_per_shard, model_version),
+            name=f"classify-shard-{shard_id}",
+        )
+        for shard_id, (lower, upper, last) in enumerate(shard_ranges)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+    failed = [shard_id for shard_id, process in enumerate(processes) if process.exitcode != 0]
+    if failed:
+        print(f"Shard(s) {failed} failed; run again to resume them from their checkpoints.")
+    return failed
+
+
+def main():
+    if NUM_SHARDS > 1:
+        if not run_sharded():
+            print("Document classification and update process completed.")
+        return
+
+    # Load model and tokenizer
+    model, tokenizer = load_model()
+    model_version = get_model_version()
+
+    # Connect to MongoDB
+    collection = connect_to_mongodb()
+
+    # Iterate over the pending email documents, one chunk at a time.
+    cursor = iter(collection.find(pending_query(model_version), PROJECTION))
+    with PredictionWriter(collection) as writer:
+        while True:
+            docs = list(islice(cursor, DOCUMENT_CHUNK_SIZE))
+            if not docs:
+                break
+            classify_chunk(writer, docs, model, tokenizer, model_version)
+    report_writes(writer.close())
+
     print("Document classification and update process completed.")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,10 +1,140 @@
+import hashlib
+import os
+
 import torch
 from transformers import AutoTokenizer, AutoModelForSequenceClassification
+from transformers.modeling_outputs import SequenceClassifierOutput
+
+# Inference backend used by load_model:
+#   "pytorch"   - the FP32 model as saved by training
+#   "quantized" - dynamic INT8 quantization of the Linear layers (CPU only)
+#   "onnx"      - ONNX Runtime session over the file written by export_onnx.py
+INFERENCE_BACKEND = "pytorch"
+INFERENCE_BACKENDS = ("pytorch", "quantized", "onnx")
+
+# File name of the exported model inside the model directory
+ONNX_MODEL_FILE = "model.onnx"
+ONNX_OPSET = 17
+# ONNX Runtime intra-op threads; None lets ONNX Runtime decide
+ONNX_INTRA_OP_THREADS = None
+
 
-def load_model(model_path="email_classifier_llm_latest"):
+def load_model(model_path="email_classifier_llm_latest", backend=None):
     """
     Loads the fine-tuned model and tokenizer from the specified directory.
+
+    backend ("pytorch", "quantized" or "onnx") defaults to INFERENCE_BACKEND.
     """
+    backend = backend or INFERENCE_BACKEND
+    if backend not in INFERENCE_BACKENDS:
+        raise ValueError(f"Unknown inference backend {backend!r}, expected one of {INFERENCE_BACKENDS}")
+
     tokenizer = AutoTokenizer.from_pretrained(model_path)
-    model = AutoModelForSequenceClassification.from_pretrained(model_path)
-    return model, tokenizer
\ No newline at end of file
+    if backend == "onnx":
+        model = OnnxSequenceClassifier(os.path.join(model_path, ONNX_MODEL_FILE))
+    else:
+        model = AutoModelForSequenceClassification.from_pretrained(model_path)
+        if backend == "quantized":
+            model = quantize_model(model)
+    return model, tokenizer
+
+
+def get_model_version(model_path="email_classifier_llm_latest"):
+    """
+    Returns a short hash of the files in the model directory, stored with
+    every prediction so documents classified by an older model can be found.
+
+    The exported ONNX model (and its external data) is derived from the same
+    weights and is left out.
+    """
+    digest = hashlib.sha256()
+    for name in sorted(os.listdir(model_path)):
+        path = os.path.join(model_path, name)
+        if name.startswith(ONNX_MODEL_FILE) or not os.path.isfile(path):
+            continue
+        digest.update(name.encode("utf-8"))
+        with open(path, "rb") as model_file:
+            for block in iter(lambda: model_file.read(1024 * 1024), b""):
+                digest.update(block)
+    return digest.hexdigest()[:16]
+
+
+def quantize_model(model):
+    """
+    Returns a copy of the model with its Linear layers dynamically quantized
+    to INT8 for CPU inference.
+    """
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+class _ExportWrapper(torch.nn.Module):
+    """Exposes the logits and the last-layer attentions as plain tensor outputs."""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids, attention_mask):
+        outputs = self.model(input_ids=input_ids, attention_mask=attention_mask, output_attentions=True)
+        return outputs.logits, outputs.attentions[-1]
+
+
+def export_onnx_model(model, tokenizer, onnx_path, opset=ONNX_OPSET):
+    """
+    Exports the classifier to ONNX with dynamic batch and sequence axes.
+
+    The graph has "input_ids" and "attention_mask" inputs, and "logits" and
+    "last_attention" (last layer attentions) outputs, so token attribution
+    keeps working on the ONNX backend.
+    """
+    # Attention weights are only returned by the eager attention implementation
+    if hasattr(model, "set_attn_implementation"):
+        model.set_attn_implementation("eager")
+    wrapper = _ExportWrapper(model).eval()
+
+    sample = tokenizer(["sample email"], return_tensors="pt")
+    with torch.no_grad():
+        torch.onnx.export(
+            wrapper,
+            (sample["input_ids"], sample["attention_mask"]),
+            onnx_path,
+            input_names=["input_ids", "attention_mask"],
+            output_names=["logits", "last_attention"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+                "logits": {0: "batch"},
+                "last_attention": {0: "batch", 2: "sequence", 3: "sequence"},
+            },
+            opset_version=opset,
+            dynamo=True,
+        )
+    return onnx_path
+
+
+class OnnxSequenceClassifier:
+    """
+    Runs an exported classifier with ONNX Runtime behind the call signature
+    classify_email uses for the PyTorch model.
+    """
+
+    def __init__(self, onnx_path, intra_op_threads=None):
+        import onnxruntime  # Only needed by the "onnx" backend
+
+        options = onnxruntime.SessionOptions()
+        intra_op_threads = intra_op_threads or ONNX_INTRA_OP_THREADS
+        if intra_op_threads:
+            options.intra_op_num_threads = intra_op_threads
+        self.session = onnxruntime.InferenceSession(
+            onnx_path, options, providers=["CPUExecutionProvider"]
+        )
+
+    def __call__(self, input_ids, attention_mask, output_attentions=False, **kwargs):
+        output_names = ["logits", "last_attention"] if output_attentions else ["logits"]
+        outputs = self.session.run(
+            output_names,
+            {"input_ids": input_ids.cpu().numpy(), "attention_mask": attention_mask.cpu().numpy()},
+        )
+        # Only the last layer is exported, which is the one classify_email uses
+        attentions = (torch.from_numpy(outputs[1]),) if output_attentions else None
+        return SequenceClassifierOutput(logits=torch.from_numpy(outputs[0]), attentions=attentions)
@@ -1,6 +1,14 @@
-from pymongo import MongoClient
+import time
+
+from pymongo import MongoClient, UpdateOne
+from pymongo.errors import BulkWriteError
 from typing import Dict, List
 
+# Predictions buffered by PredictionWriter before a bulk_write, and the
+# longest time (seconds) a buffered prediction waits for its write
+BULK_BATCH_SIZE = 500
+BULK_FLUSH_INTERVAL = 5.0
+
 def connect_to_mongodb(
     uri: str = "mongodb://localhost:27017",
     db_name: str = "emails_train_db30",
@@ -14,14 +22,100 @@ def connect_to_mongodb(
     collection = db[collection_name]
     return collection
 
+def _prediction_fields(
+    predicted_label: str, confidence_score: float, important_tokens: List[Dict[str, any]], model_version: str = None
+) -> Dict[str, any]:
+    fields = {"predicted_label": predicted_label, "confidence_score": confidence_score, "important_tokens": important_tokens}
+    if model_version is not None:
+        fields["model_version"] = model_version
+    return fields
+
 def update_email_document(
-    collection: any, doc_id: any, predicted_label: str, confidence_score: float, important_tokens: List[Dict[str, any]]
+    collection: any, doc_id: any, predicted_label: str, confidence_score: float, important_tokens: List[Dict[str, any]],
+    model_version: str = None,
 ) -> None:
     """
     Updates the email document in MongoDB with the predicted label,
-    confidence score, and important tokens.
+    confidence score, and important tokens, and the version of the model
+    that produced them when given.
     """
     collection.update_one(
         {"_id": doc_id},
-        {"$set": {"predicted_label": predicted_label, "confidence_score": confidence_score, "important_tokens": important_tokens}},
-    )
\ No newline at end of file
+        {"$set": _prediction_fields(predicted_label, confidence_score, important_tokens, model_version)},
+    )
+
+class PredictionWriter:
+    """
+    Buffers prediction updates and writes them with unordered bulk_write
+    calls, every batch_size updates or once the oldest buffered update is
+    flush_interval seconds old.
+
+    Use it as a context manager, or call close(), so the last updates are
+    written. matched_count and modified_count add up over all flushes;
+    failed_ids lists the _ids whose update failed.
+    """
+
+    def __init__(self, collection: any, batch_size: int = None, flush_interval: float = None):
+        self.collection = collection
+        self.batch_size = batch_size or BULK_BATCH_SIZE
+        self.flush_interval = BULK_FLUSH_INTERVAL if flush_interval is None else flush_interval
+        self.matched_count = 0
+        self.modified_count = 0
+        self.failed_ids: List[any] = []
+        self._operations: List[UpdateOne] = []
+        self._doc_ids: List[any] = []
+        self._oldest = None
+
+    def add(
+        self, doc_id: any, predicted_label: str, confidence_score: float, important_tokens: List[Dict[str, any]],
+        model_version: str = None,
+    ) -> None:
+        """Buffers the prediction of one document, flushing when due."""
+        if not self._operations:
+            self._oldest = time.monotonic()
+        self._operations.append(UpdateOne(
+            {"_id": doc_id},
+            {"$set": _prediction_fields(predicted_label, confidence_score, important_tokens, model_version)},
+        ))
+        self._doc_ids.append(doc_id)
+        if (len(self._operations) >= self.batch_size
+                or time.monotonic() - self._oldest >= self.flush_interval):
+            self.flush()
+
+    def flush(self) -> None:
+        """Writes the buffered predictions with one unordered bulk_write."""
+        if not self._operations:
+            return
+        operations, doc_ids = self._operations, self._doc_ids
+        self._operations, self._doc_ids = [], []
+
+        try:
+            result = self.collection.bulk_write(operations, ordered=False)
+            self.matched_count += result.matched_count
+            self.modified_count += result.modified_count
+        except BulkWriteError as e:
+            # With ordered=False the rest of the batch is still applied
+            self.matched_count += e.details.get("nMatched", 0)
+            self.modified_count += e.details.get("nModified", 0)
+            for error in e.details.get("writeErrors", []):
+                doc_id = doc_ids[error["index"]]
+                print(f"Error updating document {doc_id}: {error.get('errmsg', 'unknown error')}")
+                self.failed_ids.append(doc_id)
+        except Exception as e:
+            print(f"Error writing {len(doc_ids)} prediction(s): {e}")
+            self.failed_ids.extend(doc_ids)
+
+    def close(self) -> Dict[str, any]:
+        """Flushes the remaining predictions and returns the totals."""
+        self.flush()
+        return {
+            "matched_count": self.matched_count,
+            "modified_count": self.modified_count,
+            "failed_ids": list(self.failed_ids),
+        }
+
+    def __enter__(self) -> "PredictionWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
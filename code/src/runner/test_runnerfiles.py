@@ -5,11 +5,14 @@ from runner.main import main
 # filepath: e:\hackathon_25\src\runner\test_main.py
 
 class TestMain(unittest.TestCase):
+    @patch("runner.main.NUM_SHARDS", 1)
+    @patch("runner.main.get_model_version", return_value="v1")
     @patch("runner.main.load_model")
     @patch("runner.main.connect_to_mongodb")
-    @patch("runner.main.classify_email")
-    @patch("runner.main.update_email_document")
-    def test_main(self, mock_update_email_document, mock_classify_email, mock_connect_to_mongodb, mock_load_model):
+    @patch("runner.main.classify_emails")
+    @patch("runner.main.PredictionWriter")
+    def test_main(self, mock_prediction_writer, mock_classify_email, mock_connect_to_mongodb, mock_load_model,
+                  mock_get_model_version):
         # Mock load_model to return a fake model and tokenizer
         mock_load_model.return_value = ("mock_model", "mock_tokenizer")
 
@@ -21,8 +24,8 @@ class TestMain(unittest.TestCase):
         ]
         mock_connect_to_mongodb.return_value = mock_collection
 
-        # Mock classify_email to return fake classification results
-        mock_classify_email.side_effect = [
+        # Mock classify_emails to return fake classification results
+        mock_classify_email.return_value = [
             ("spam", 0.95, ["test", "subject"]),
             ("ham", 0.89, ["another", "body"]),
         ]
@@ -36,15 +39,16 @@ class TestMain(unittest.TestCase):
         # Assert connect_to_mongodb was called once
         mock_connect_to_mongodb.assert_called_once()
 
-        # Assert classify_email was called twice (once for each document)
-        mock_classify_email.assert_any_call("Test Subject Test Body", "mock_model", "mock_tokenizer")
-        mock_classify_email.assert_any_call("Another Subject Another Body", "mock_model", "mock_tokenizer")
-        self.assertEqual(mock_classify_email.call_count, 2)
+        # Assert classify_emails was called once with both documents
+        mock_classify_email.assert_called_once_with(
+            ["Test Subject Test Body", "Another Subject Another Body"], "mock_model", "mock_tokenizer"
+        )
 
-        # Assert update_email_document was called twice with correct arguments
-        mock_update_email_document.assert_any_call(mock_collection, 1, "spam", 0.95, ["test", "subject"])
-        mock_update_email_document.assert_any_call(mock_collection, 2, "ham", 0.89, ["another", "body"])
-        self.assertEqual(mock_update_email_document.call_count, 2)
+        # Assert both predictions were queued on the PredictionWriter
+        mock_writer = mock_prediction_writer.return_value.__enter__.return_value
+        mock_writer.add.assert_any_call(1, "spam", 0.95, ["test", "subject"], "v1")
+        mock_writer.add.assert_any_call(2, "ham", 0.89, ["another", "body"], "v1")
+        self.assertEqual(mock_writer.add.call_count, 2)
 
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
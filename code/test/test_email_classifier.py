@@ -1,6 +1,11 @@
 import unittest
 from unittest.mock import MagicMock
-from runner.email_classifier import classify_email
+
+import torch
+
+from runner.email_classifier import classify_email, classify_emails
+from tiny_model import build_tiny_model
+
 
 class TestEmailClassifier(unittest.TestCase):
     def test_classify_email(self):
@@ -22,5 +27,81 @@ class TestEmailClassifier(unittest.TestCase):
         self.assertIsInstance(confidence_score, float)
         self.assertIsInstance(important_tokens, list)
 
+    def test_classify_emails_matches_classify_email(self):
+        model, tokenizer = build_tiny_model()
+        email_texts = [
+            "please provide the loan status report",
+            "help",
+            "need help with my account update progress please",
+            "loan status",
+            "the update",
+        ]
+
+        results = classify_emails(email_texts, model, tokenizer, batch_size=2, attribution="full")
+
+        self.assertEqual(len(results), len(email_texts))
+        for email_text, (label, confidence, important_tokens) in zip(email_texts, results):
+            expected_label, expected_confidence, expected_tokens = classify_email(
+                email_text, model, tokenizer, attribution="full")
+            self.assertEqual(label, expected_label)
+            self.assertAlmostEqual(confidence, expected_confidence, places=5)
+
+            # Same tokens and scores, without the padding up to max_length
+            expected_tokens = [t for t in expected_tokens if t["token"] != "[PAD]"]
+            self.assertEqual(sorted((t["token"], t["word"]) for t in important_tokens),
+                             sorted((t["token"], t["word"]) for t in expected_tokens))
+            for token, expected in zip(important_tokens, expected_tokens):
+                self.assertAlmostEqual(token["attention_score"], expected["attention_score"], places=5)
+
+    def test_classify_emails_pads_each_batch_to_its_longest_item(self):
+        model, tokenizer = build_tiny_model()
+        model = MagicMock(wraps=model)
+        email_texts = ["loan", "please provide the loan status report", "help", "need help with my account"]
+
+        classify_emails(email_texts, model, tokenizer, batch_size=2)
+
+        # Sorted by length: the two short texts share a batch, then the two long ones
+        widths = [call.kwargs["input_ids"].shape for call in model.call_args_list]
+        self.assertEqual(widths, [torch.Size([2, 3]), torch.Size([2, 8])])
+
+    def test_top_k_attribution_skips_padding_and_special_tokens(self):
+        model, tokenizer = build_tiny_model()
+        email_texts = ["please provide the loan status report", "help"]
+
+        _, _, full_tokens = classify_email(email_texts[0], model, tokenizer, attribution="full")
+        _, _, top_tokens = classify_email(email_texts[0], model, tokenizer, attribution="topk", top_k=3)
+
+        # The three highest-scoring word tokens of the full analysis
+        expected = [t for t in full_tokens if t["token"] not in ("[PAD]", "[CLS]", "[SEP]")][:3]
+        self.assertEqual([t["token"] for t in top_tokens], [t["token"] for t in expected])
+        for token, expected_token in zip(top_tokens, expected):
+            self.assertAlmostEqual(token["attention_score"], expected_token["attention_score"], places=6)
+
+        # A short text has fewer candidate tokens than top_k
+        batched = classify_emails(email_texts, model, tokenizer, attribution="topk", top_k=3)
+        self.assertEqual([t["token"] for t in batched[0][2]], [t["token"] for t in expected])
+        self.assertEqual([t["token"] for t in batched[1][2]], ["help"])
+
+    def test_attribution_off_skips_attentions(self):
+        model, tokenizer = build_tiny_model()
+        model = MagicMock(wraps=model)
+
+        label, confidence, important_tokens = classify_email("loan status", model, tokenizer, attribution="off")
+        results = classify_emails(["loan status"], model, tokenizer, attribution="off")
+
+        self.assertEqual(important_tokens, [])
+        self.assertEqual(results, [(label, results[0][1], [])])
+        self.assertAlmostEqual(results[0][1], confidence, places=5)
+        for call in model.call_args_list:
+            self.assertFalse(call.kwargs["output_attentions"])
+
+    def test_unknown_attribution_mode(self):
+        with self.assertRaises(ValueError):
+            classify_emails(["loan"], MagicMock(), MagicMock(), attribution="everything")
+
+    def test_classify_emails_empty(self):
+        self.assertEqual(classify_emails([], MagicMock(), MagicMock()), [])
+
+
 if __name__ == "__main__":
-    unittest.main()
\ No newline at end of file
+    unittest.main()
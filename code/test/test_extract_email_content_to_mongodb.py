@@ -1,15 +1,89 @@
+import io
+import multiprocessing
+import os
+import tempfile
+import time
 import unittest
+import zipfile
 from unittest.mock import patch, MagicMock, mock_open
+from email import encoders
+from email.mime.base import MIMEBase
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+from openpyxl import Workbook
+from PIL import Image
+from pymongo.errors import BulkWriteError
+from extract_data_from_emails_attachments import extract_email_content_to_mongodb
 from extract_data_from_emails_attachments.extract_email_content_to_mongodb import (
+    IngestionStats,
+    batch_worker,
+    buffered_worker,
+    check_manifest,
+    evict_cache,
     extract_text_from_image,
+    flush_batch,
+    init_worker,
+    iter_email_files,
+    open_manifest,
+    process_files_in_parallel,
     process_msg_attachment,
     process_attachment,
+    preprocess_image_for_ocr,
     process_email_file,
+    record_processed,
     worker,
 )
 
 
+def build_pdf(page_texts):
+    """Builds a minimal PDF with one line of Helvetica text per page."""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None,
+               "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for text in page_texts:
+        stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        objects.append("<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>")
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+
+    pdf = "%PDF-1.4\n"
+    offsets = []
+    for number, obj in enumerate(objects, start=1):
+        offsets.append(len(pdf))
+        pdf += f"{number} 0 obj\n{obj}\nendobj\n"
+    xref_offset = len(pdf)
+    pdf += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n"
+    pdf += "".join(f"{offset:010d} 00000 n \n" for offset in offsets)
+    pdf += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n"
+    return pdf.encode("latin-1")
+
+
+def record_worker(file_path):
+    """process_email_file stand-in that leaves a marker file per worker process."""
+    marker = os.path.join(os.path.dirname(file_path), f"worker-{os.getpid()}.log")
+    with open(marker, "a") as f:
+        f.write(file_path + "\n")
+    time.sleep(0.05)
+    return {"filename": os.path.basename(file_path)}
+
+
 class TestExtractEmailContentToMongoDB(unittest.TestCase):
+    def setUp(self):
+        # Drop any per-process MongoDB state left behind by a previous test
+        extract_email_content_to_mongodb._client = None
+        extract_email_content_to_mongodb._collection = None
+        extract_email_content_to_mongodb._connections_opened = None
+        extract_email_content_to_mongodb._files_processed = None
+        extract_email_content_to_mongodb._manifest = None
+        extract_email_content_to_mongodb._msg_folder = None
+        extract_email_content_to_mongodb._pending = []
+        extract_email_content_to_mongodb._pending_fingerprints = {}
+        extract_email_content_to_mongodb._last_flush = None
+        extract_email_content_to_mongodb._flush_results = None
+
     @patch("extract_data_from_emails_attachments.extract_email_content_to_mongodb.Image.open")
     @patch("extract_data_from_emails_attachments.extract_email_content_to_mongodb.pytesseract.image_to_string")
     def test_extract_text_from_image(self, mock_image_to_string, mock_image_open):
@@ -23,12 +97,54 @@ class TestExtractEmailContentToMongoDB(unittest.TestCase):
         mock_image_open.assert_called_once()
         mock_image_to_string.assert_called_once()
 
+    @patch("extract_data_from_emails_attachments.extract_email_content_to_mongodb.OCR_PREPROCESS", False)
+    @patch("extract_data_from_emails_attachments.extract_email_content_to_mongodb.pytesseract.image_to_string")
+    def test_extract_text_from_image_ocrs_every_frame(self, mock_image_to_string):
+        mock_image_to_string.side_effect = lambda frame, timeout: f"frame {frame.getpixel((0, 0))}"
+        frames = [Image.new("L", (8, 8), color) for color in (10, 20, 30)]
+        buffer = io.BytesIO()
+        frames[0].save(buffer, format="TIFF", save_all=True, append_images=frames[1:])
+
+        result = extract_text_from_image(buffer.getvalue())
+
+        self.assertEqual(result, "frame 10\nframe 20\nframe 30")
+        self.assertEqual(mock_image_to_string.call_count, 3)
+
+    @patch("extract_data_from_emails_attachments.extract_email_content_to_mongodb.Image.open")
+    @patch("extract_data_from_emails_attachments.extract_email_content_to_mongodb.pytesseract.image_to_string")
+    def test_extract_text_from_image_timeout(self, mock_image_to_string, mock_image_open):
+        mock_image_to_string.side_effect = RuntimeError("Tesseract process timeout")
+        mock_image_open.return_value = MagicMock(n_frames=1)
+
+        result = extract_text_from_image(b"fake_image_data")
+
+        self.assertEqual(result, "OCR Error: Tesseract process timeout")
+
+    def test_preprocess_image_for_ocr(self):
+        photo = Image.new("RGB", (6000, 4000), "white")
+        photo.paste((0, 0, 0), (1000, 1000, 5000, 3000))
+
+        prepared = preprocess_image_for_ocr(photo)
+
+        self.assertEqual(prepared.mode, "L")
+        self.assertEqual(max(prepared.size), 3300)
+        self.assertIsNone(preprocess_image_for_ocr(Image.new("RGB", (800, 600), "white")))
+        self.assertIsNone(preprocess_image_for_ocr(Image.new("RGB", (8, 8), "black")))
+
+    @patch("extract_data_from_emails_attachments.extract_email_content_to_mongodb.pytesseract.image_to_string")
+    def test_extract_text_from_image_skips_blank_image(self, mock_image_to_string):
+        buffer = io.BytesIO()
+        Image.new("RGB", (640, 480), "white").save(buffer, format="PNG")
+
+        result = extract_text_from_image(buffer.getvalue())
+
+        self.assertEqual(result, "")
+        mock_image_to_string.assert_not_called()
+
     @patch("extract_data_from_emails_attachments.extract_email_content_to_mongodb.message_from_bytes")
-    @patch("extract_data_from_emails_attachments.extract_email_content_to_mongodb.tempfile.NamedTemporaryFile")
-    def test_process_msg_attachment(self, mock_tempfile, mock_message_from_bytes):
-        mock_tempfile.return_value.__enter__.return_value.name = "temp_msg_file.msg"
+    def test_process_msg_attachment(self, mock_message_from_bytes):
         mock_message_from_bytes.return_value = MagicMock(
-            get=lambda x: "Test Value",
+            get=lambda *args: "Test Value",
             is_multipart=lambda: False,
             get_payload=lambda decode: b"Test Body",
         )
@@ -37,10 +153,33 @@ class TestExtractEmailContentToMongoDB(unittest.TestCase):
         attachment_content = b"fake_msg_data"
         result = process_msg_attachment(attachment_name, attachment_content)
 
+        mock_message_from_bytes.assert_called_once_with(attachment_content)
         self.assertEqual(result["type"], "msg")
         self.assertEqual(result["from"], "Test Value")
         self.assertEqual(result["body"], "Test Body")
 
+    def test_process_msg_attachment_depth_limit(self):
+        inner = MIMEText("Innermost body")
+        inner["Subject"] = "Level 0"
+        for level in range(1, 4):
+            outer = MIMEMultipart()
+            outer["Subject"] = f"Level {level}"
+            outer.attach(MIMEText(f"Body {level}"))
+            part = MIMEBase("application", "octet-stream")
+            part.set_payload(inner.as_bytes())
+            encoders.encode_base64(part)
+            part.add_header("Content-Disposition", "attachment", filename=f"level{level - 1}.msg")
+            outer.attach(part)
+            inner = outer
+
+        with patch.object(extract_email_content_to_mongodb, "MAX_ATTACHMENT_DEPTH", 2):
+            result = process_msg_attachment("level3.msg", inner.as_bytes())
+
+        self.assertEqual(result["subject"], "Level 3")
+        level2 = result["attachments"][0]
+        self.assertEqual(level2["subject"], "Level 2")
+        self.assertEqual(level2["attachments"][0]["type"], "msg_error")
+
     @patch("extract_data_from_emails_attachments.extract_email_content_to_mongodb.Document")
     def test_process_attachment_docx(self, mock_document):
         mock_document.return_value.paragraphs = [MagicMock(text="Paragraph 1"), MagicMock(text="Paragraph 2")]
@@ -52,6 +191,28 @@ class TestExtractEmailContentToMongoDB(unittest.TestCase):
         self.assertEqual(result["type"], "docx")
         self.assertEqual(result["content"], "Paragraph 1\nParagraph 2")
 
+    def test_process_attachment_xlsx(self):
+        wb = Workbook()
+        ws = wb.active
+        ws.title = "Loans"
+        for row in [("Account", "Amount"), (123456, 50000), (654321, None)]:
+            ws.append(row)
+        buffer = io.BytesIO()
+        wb.save(buffer)
+
+        result = process_attachment("test.xlsx", buffer.getvalue())
+
+        self.assertEqual(result, {
+            "type": "xlsx",
+            "content": "Sheet: Loans\nAccount, Amount\n123456, 50000\n654321, \n",
+        })
+
+        with patch.object(extract_email_content_to_mongodb, "XLSX_MAX_ROWS_PER_SHEET", 2):
+            truncated = process_attachment("test.xlsx", buffer.getvalue())
+
+        self.assertEqual(truncated["content"], "Sheet: Loans\nAccount, Amount\n123456, 50000\n")
+        self.assertTrue(truncated["truncated"])
+
     @patch("extract_data_from_emails_attachments.extract_email_content_to_mongodb.PdfReader")
     def test_process_attachment_pdf(self, mock_pdf_reader):
         mock_pdf_reader.return_value.pages = [MagicMock(extract_text=lambda: "Page 1 text")]
@@ -63,6 +224,112 @@ class TestExtractEmailContentToMongoDB(unittest.TestCase):
         self.assertEqual(result["type"], "pdf")
         self.assertEqual(result["content"], "Page 1 text")
 
+    @patch("extract_data_from_emails_attachments.extract_email_content_to_mongodb.PDF_MAX_PAGES", 2)
+    @patch("extract_data_from_emails_attachments.extract_email_content_to_mongodb.PdfReader")
+    def test_process_attachment_pdf_page_budget(self, mock_pdf_reader):
+        pages = [MagicMock() for _ in range(5)]
+        for number, page in enumerate(pages, start=1):
+            page.extract_text.return_value = f"Page {number} text"
+        mock_pdf_reader.return_value.pages = pages
+
+        result = process_attachment("statement.pdf", b"fake_pdf_data")
+
+        self.assertEqual(result["content"], "Page 1 text\nPage 2 text")
+        self.assertTrue(result["truncated"])
+        pages[2].extract_text.assert_not_called()
+
+    @patch("extract_data_from_emails_attachments.extract_email_content_to_mongodb.PDF_MAX_CHARS", 15)
+    @patch("extract_data_from_emails_attachments.extract_email_content_to_mongodb.PdfReader")
+    def test_process_attachment_pdf_char_budget(self, mock_pdf_reader):
+        pages = [MagicMock() for _ in range(3)]
+        for number, page in enumerate(pages, start=1):
+            page.extract_text.return_value = f"Page {number} text"
+        mock_pdf_reader.return_value.pages = pages
+
+        result = process_attachment("statement.pdf", b"fake_pdf_data")
+
+        self.assertEqual(result["content"], "Page 1 text\nPag")
+        self.assertTrue(result["truncated"])
+        pages[2].extract_text.assert_not_called()
+
+    def test_process_attachment_pdf_budgets_on_real_pdf(self):
+        pdf = build_pdf([f"Page {number} text" for number in range(1, 6)])
+
+        budgets = [
+            (3, None, "Page 1 text\nPage 2 text\nPage 3 text", True),
+            (None, 15, "Page 1 text\nPag", True),
+            (None, None, "\n".join(f"Page {number} text" for number in range(1, 6)), False),
+        ]
+        for max_pages, max_chars, content, truncated in budgets:
+            with patch.object(extract_email_content_to_mongodb, "PDF_MAX_PAGES", max_pages), \
+                    patch.object(extract_email_content_to_mongodb, "PDF_MAX_CHARS", max_chars):
+                result = process_attachment("statement.pdf", pdf)
+
+            self.assertEqual(result["content"], content)
+            self.assertEqual(result.get("truncated", False), truncated)
+
+    @patch("extract_data_from_emails_attachments.extract_email_content_to_mongodb.Document")
+    def test_process_attachment_zip_dispatches_entries(self, mock_document):
+        mock_document.return_value.paragraphs = [MagicMock(text="Loan agreement")]
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zip_file:
+            zip_file.writestr("notes.txt", "Plain notes")
+            zip_file.writestr("contract.docx", b"fake_docx_data")
+            zip_file.writestr("blob.bin", b"\x00\x01\x02")
+
+        result = process_attachment("bundle.zip", buffer.getvalue())
+
+        self.assertEqual(result["type"], "zip")
+        self.assertEqual(result["content"], (
+            "Zip Entry: notes.txt\nPlain notes\n"
+            "Zip Entry: contract.docx\nLoan agreement\n"
+            "Zip Entry: blob.bin\nBinary content in blob.bin\n"
+        ))
+        self.assertNotIn("truncated", result)
+
+    def test_process_attachment_zip_skips_bomb_entries(self):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zip_file:
+            zip_file.writestr("zeros.txt", b"0" * (10 * 1024 * 1024))
+            zip_file.writestr("notes.txt", "Plain notes")
+
+        result = process_attachment("bomb.zip", buffer.getvalue())
+
+        self.assertTrue(result["truncated"])
+        self.assertTrue(result["content"].startswith("Skipped Zip Entry: zeros.txt (compression ratio"))
+        self.assertIn("Zip Entry: notes.txt\nPlain notes\n", result["content"])
+
+    @patch("extract_data_from_emails_attachments.extract_email_content_to_mongodb.ZIP_MAX_ENTRIES", 10)
+    def test_process_attachment_nested_zips_share_budget(self):
+        inner = io.BytesIO()
+        with zipfile.ZipFile(inner, "w") as zip_file:
+            for number in range(3):
+                zip_file.writestr(f"notes{number}.txt", "Plain notes")
+        outer = io.BytesIO()
+        with zipfile.ZipFile(outer, "w") as zip_file:
+            for number in range(1, 5):
+                zip_file.writestr(f"inner{number}.zip", inner.getvalue())
+
+        result = process_attachment("nested.zip", outer.getvalue())
+
+        # 10 entries in total: inner1 and inner2 in full, inner3 and one of its entries
+        self.assertTrue(result["truncated"])
+        self.assertEqual(result["content"].count("Plain notes"), 7)
+        self.assertIn("Zip Entry: inner3.zip", result["content"])
+        self.assertNotIn("inner4.zip", result["content"])
+
+    @patch("extract_data_from_emails_attachments.extract_email_content_to_mongodb.ZIP_MAX_ENTRIES", 5)
+    def test_process_attachment_zip_counts_skipped_entries(self):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zip_file:
+            for number in range(20):
+                zip_file.writestr(f"zeros{number}.txt", b"0" * 100000)
+
+        result = process_attachment("bomb.zip", buffer.getvalue())
+
+        self.assertTrue(result["truncated"])
+        self.assertEqual(result["content"].count("Skipped Zip Entry"), 5)
+
     @patch("builtins.open", new_callable=mock_open, read_data=b"fake_email_data")
     @patch("extract_data_from_emails_attachments.extract_email_content_to_mongodb.message_from_bytes")
     def test_process_email_file(self, mock_message_from_bytes, mock_open_file):
@@ -79,6 +346,40 @@ class TestExtractEmailContentToMongoDB(unittest.TestCase):
         self.assertEqual(result["body"], "Test Body")
         self.assertEqual(result["status"], "processed")
 
+    @patch("extract_data_from_emails_attachments.extract_email_content_to_mongodb.STORE_TIMINGS", True)
+    def test_process_email_file_records_timings(self):
+        message = MIMEMultipart()
+        message["Subject"] = "Statement"
+        message.attach(MIMEText("Please see attached"))
+        part = MIMEBase("application", "octet-stream")
+        part.set_payload(b"Account 123456")
+        encoders.encode_base64(part)
+        part.add_header("Content-Disposition", "attachment", filename="notes.txt")
+        message.attach(part)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_path = os.path.join(tmp_dir, "statement.eml")
+            with open(file_path, "wb") as f:
+                f.write(message.as_bytes())
+            result = process_email_file(file_path)
+
+        self.assertEqual(
+            set(result["timings"]), {"read", "mime_parse", "attachment_text", "process_email"})
+
+    def test_ingestion_stats_summary(self):
+        stats = IngestionStats()
+        for millis in range(1, 101):
+            stats.add_email({"read": [millis / 1000, 1000], "mime_parse": [0.001, 1000]})
+
+        summary = stats.summary()
+
+        self.assertEqual(summary["files"], 100)
+        self.assertEqual(summary["bytes"], 100000)
+        self.assertAlmostEqual(summary["stages"]["read"]["p50"], 0.050)
+        self.assertAlmostEqual(summary["stages"]["read"]["p95"], 0.095)
+        self.assertAlmostEqual(summary["stages"]["read"]["p99"], 0.099)
+        self.assertAlmostEqual(summary["stages"]["mime_parse"]["bytes_per_sec"], 1000000)
+
     @patch("extract_data_from_emails_attachments.extract_email_content_to_mongodb.MongoClient")
     @patch("extract_data_from_emails_attachments.extract_email_content_to_mongodb.process_email_file")
     def test_worker(self, mock_process_email_file, mock_mongo_client):
@@ -88,7 +389,7 @@ class TestExtractEmailContentToMongoDB(unittest.TestCase):
             "status": "processed",
         }
         mock_collection = MagicMock()
-        mock_mongo_client.return_value.__getitem__.return_value = mock_collection
+        mock_mongo_client.return_value.__getitem__.return_value.__getitem__.return_value = mock_collection
 
         file_path = "test_email.eml"
         worker(file_path)
@@ -100,6 +401,239 @@ class TestExtractEmailContentToMongoDB(unittest.TestCase):
             upsert=True,
         )
 
+    @patch("extract_data_from_emails_attachments.extract_email_content_to_mongodb.MongoClient")
+    @patch("extract_data_from_emails_attachments.extract_email_content_to_mongodb.process_email_file")
+    def test_worker_reuses_process_connection(self, mock_process_email_file, mock_mongo_client):
+        mock_process_email_file.return_value = {"filename": "test_email.eml"}
+        connections_opened = multiprocessing.Value("i", 0)
+        files_processed = multiprocessing.Value("i", 0)
+
+        init_worker(connections_opened, files_processed)
+        for file_path in ["a.eml", "b.eml", "c.eml"]:
+            worker(file_path)
+
+        mock_mongo_client.assert_called_once()
+        self.assertEqual(connections_opened.value, 1)
+        self.assertEqual(files_processed.value, 3)
+
+    def test_flush_batch_reports_failed_files(self):
+        mock_collection = MagicMock()
+        mock_collection.bulk_write.side_effect = BulkWriteError({
+            "writeErrors": [{"index": 1, "errmsg": "duplicate key"}],
+            "upserted": [{"index": 0, "_id": "new_id"}],
+        })
+        batch = [
+            ("a.eml", {"filename": "a.eml"}),
+            ("b.eml", {"filename": "b.eml"}),
+            ("c.eml", {"filename": "c.eml"}),
+        ]
+
+        failed = flush_batch(mock_collection, batch)
+
+        self.assertEqual(failed, ["b.eml"])
+        operations = mock_collection.bulk_write.call_args[0][0]
+        self.assertEqual(len(operations), 3)
+        self.assertEqual(mock_collection.bulk_write.call_args[1], {"ordered": False})
+
+    @patch("extract_data_from_emails_attachments.extract_email_content_to_mongodb.MongoClient")
+    @patch("extract_data_from_emails_attachments.extract_email_content_to_mongodb.process_email_file")
+    def test_batch_worker_flushes_by_batch_size(self, mock_process_email_file, mock_mongo_client):
+        mock_process_email_file.side_effect = lambda path: {"filename": path}
+        mock_collection = MagicMock()
+        mock_collection.bulk_write.return_value = MagicMock(upserted_ids={})
+        mock_mongo_client.return_value.__getitem__.return_value.__getitem__.return_value = mock_collection
+
+        result = batch_worker(["a.eml", "b.eml", "c.eml"], batch_size=2, flush_interval=60)
+
+        self.assertEqual(result["failed"], [])
+        self.assertEqual(len(result["bulk_writes"]), 2)
+        self.assertEqual(mock_collection.bulk_write.call_count, 2)
+        mock_collection.update_one.assert_not_called()
+
+    @patch("extract_data_from_emails_attachments.extract_email_content_to_mongodb.process_email_file",
+           record_worker)
+    def test_bulk_mode_spreads_files_over_workers(self):
+        client = MagicMock()
+        client.return_value.__getitem__.return_value.__getitem__.return_value.bulk_write.return_value = \
+            MagicMock(upserted_ids={})
+
+        with tempfile.TemporaryDirectory() as msg_folder:
+            for number in range(8):
+                with open(os.path.join(msg_folder, f"{number}.eml"), "w") as f:
+                    f.write("")
+
+            # Far fewer files than batch_size * pool_size
+            stats = process_files_in_parallel(msg_folder, pool_size=2, batch_size=500, chunksize=1,
+                                              client_factory=client)
+            markers = [name for name in os.listdir(msg_folder) if name.startswith("worker-")]
+
+        self.assertEqual(len(markers), 2)
+        self.assertEqual(stats["files_processed"], 8)
+        self.assertEqual(stats["failed_files"], [])
+        # The buffered emails were written by the flush each worker runs on exit
+        self.assertEqual(stats["timings"]["stages"]["mongo_bulk_write"]["count"], 2)
+
+    @patch("extract_data_from_emails_attachments.extract_email_content_to_mongodb.MongoClient")
+    def test_buffered_worker_keeps_buffer_when_a_file_vanishes(self, mock_mongo_client):
+        mock_collection = MagicMock()
+        mock_collection.bulk_write.return_value = MagicMock(upserted_ids={})
+        mock_mongo_client.return_value.__getitem__.return_value.__getitem__.return_value = mock_collection
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_paths = []
+            for name in ["a.eml", "b.eml", "c.eml"]:
+                file_paths.append(os.path.join(tmp_dir, name))
+                with open(file_paths[-1], "w") as f:
+                    f.write(f"Subject: {name}\n\nBody")
+            init_worker(manifest_path=os.path.join(tmp_dir, "manifest.sqlite"), msg_folder=tmp_dir)
+
+            buffered_worker(file_paths[0], batch_size=3, flush_interval=60)
+            # Deleted between the scan and its turn in the worker
+            os.remove(file_paths[1])
+            vanished = buffered_worker(file_paths[1], batch_size=3, flush_interval=60)
+            buffered_worker(file_paths[2], batch_size=3, flush_interval=60)
+            final = batch_worker([], batch_size=3)
+            extract_email_content_to_mongodb._manifest.close()
+
+        self.assertEqual(vanished["failed"], [file_paths[1]])
+        self.assertEqual(final["failed"], [])
+        operations = mock_collection.bulk_write.call_args[0][0]
+        self.assertEqual([operation._filter for operation in operations],
+                         [{"filename": "a.eml"}, {"filename": "c.eml"}])
+
+    def test_iter_email_files(self):
+        with tempfile.TemporaryDirectory() as msg_folder:
+            os.makedirs(os.path.join(msg_folder, "nested"))
+            for name in ["a.eml", "b.msg", "notes.txt", os.path.join("nested", "c.eml")]:
+                with open(os.path.join(msg_folder, name), "w") as f:
+                    f.write("")
+
+            flat = sorted(os.path.relpath(path, msg_folder) for path in iter_email_files(msg_folder))
+            recursive = sorted(os.path.relpath(path, msg_folder)
+                               for path in iter_email_files(msg_folder, recursive=True))
+
+        self.assertEqual(flat, ["a.eml", "b.msg"])
+        self.assertEqual(recursive, ["a.eml", "b.msg", os.path.join("nested", "c.eml")])
+
+    def test_check_manifest_skips_unchanged_files(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_path = os.path.join(tmp_dir, "a.eml")
+            with open(file_path, "w") as f:
+                f.write("Subject: hello")
+            conn = open_manifest(os.path.join(tmp_dir, "manifest.sqlite"))
+
+            unchanged, fingerprint = check_manifest(conn, file_path)
+            self.assertFalse(unchanged)
+            record_processed(conn, [fingerprint])
+            self.assertTrue(check_manifest(conn, file_path)[0])
+
+            # Touched but identical content is still skipped
+            os.utime(file_path, ns=(0, 0))
+            self.assertTrue(check_manifest(conn, file_path)[0])
+
+            with open(file_path, "w") as f:
+                f.write("Subject: changed")
+            self.assertFalse(check_manifest(conn, file_path)[0])
+            conn.close()
+
+    @patch("extract_data_from_emails_attachments.extract_email_content_to_mongodb.MongoClient")
+    @patch("extract_data_from_emails_attachments.extract_email_content_to_mongodb.process_email_file")
+    def test_worker_incremental_skips_processed_file(self, mock_process_email_file, mock_mongo_client):
+        mock_process_email_file.return_value = {"filename": "a.eml"}
+        mock_collection = MagicMock()
+        mock_mongo_client.return_value.__getitem__.return_value.__getitem__.return_value = mock_collection
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_path = os.path.join(tmp_dir, "a.eml")
+            with open(file_path, "w") as f:
+                f.write("Subject: hello")
+            init_worker(manifest_path=os.path.join(tmp_dir, "manifest.sqlite"))
+
+            worker(file_path)
+            worker(file_path)
+            extract_email_content_to_mongodb._manifest.close()
+
+        mock_process_email_file.assert_called_once_with(file_path)
+        mock_collection.update_one.assert_called_once()
+
+    @patch("extract_data_from_emails_attachments.extract_email_content_to_mongodb.MongoClient")
+    def test_recursive_run_keys_same_named_files_apart(self, mock_mongo_client):
+        mock_collection = MagicMock()
+        mock_mongo_client.return_value.__getitem__.return_value.__getitem__.return_value = mock_collection
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            msg_folder = os.path.join(tmp_dir, "emails")
+            file_paths = []
+            for folder in ["a", "b"]:
+                os.makedirs(os.path.join(msg_folder, folder))
+                file_paths.append(os.path.join(msg_folder, folder, "1.eml"))
+                with open(file_paths[-1], "w") as f:
+                    f.write(f"Subject: from {folder}\n\nBody")
+            init_worker(manifest_path=os.path.join(tmp_dir, "manifest.sqlite"), msg_folder=msg_folder)
+
+            for _ in range(2):
+                for file_path in file_paths:
+                    worker(file_path)
+            extract_email_content_to_mongodb._manifest.close()
+
+        # One upsert per file, each keyed on its own path; the second pass is skipped
+        filters = [call.args[0] for call in mock_collection.update_one.call_args_list]
+        self.assertEqual(filters, [{"filename": "a/1.eml"}, {"filename": "b/1.eml"}])
+
+    @patch("extract_data_from_emails_attachments.extract_email_content_to_mongodb.Document")
+    def test_process_attachment_uses_cache(self, mock_document):
+        mock_document.return_value.paragraphs = [MagicMock(text="Paragraph 1")]
+
+        with tempfile.TemporaryDirectory() as cache_dir, \
+                patch.object(extract_email_content_to_mongodb, "ATTACHMENT_CACHE_DIR", cache_dir):
+            first = process_attachment("a.docx", b"same_docx_data")
+            second = process_attachment("copy_of_a.docx", b"same_docx_data")
+
+        self.assertEqual(first, {"type": "docx", "content": "Paragraph 1"})
+        self.assertEqual(second, first)
+        mock_document.assert_called_once()
+
+    @patch("extract_data_from_emails_attachments.extract_email_content_to_mongodb.extract_text_from_image")
+    def test_process_attachment_skips_cache_for_failed_nested_parts(self, mock_extract_text_from_image):
+        mock_extract_text_from_image.return_value = "OCR Error: Tesseract process timeout"
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w") as zip_file:
+            zip_file.writestr("notes.txt", "Plain notes")
+            zip_file.writestr("scan.png", b"fake_png_data")
+        message = MIMEMultipart()
+        message["Subject"] = "Forwarded"
+        part = MIMEBase("application", "octet-stream")
+        part.set_payload(MIMEText("Innermost body").as_bytes())
+        encoders.encode_base64(part)
+        part.add_header("Content-Disposition", "attachment", filename="inner.msg")
+        message.attach(part)
+
+        with tempfile.TemporaryDirectory() as cache_dir, \
+                patch.object(extract_email_content_to_mongodb, "ATTACHMENT_CACHE_DIR", cache_dir):
+            process_attachment("bundle.zip", buffer.getvalue())
+            # The nested msg is cut off by the depth limit
+            with patch.object(extract_email_content_to_mongodb, "MAX_ATTACHMENT_DEPTH", 1):
+                process_msg_attachment("outer.msg", message.as_bytes())
+            cached = os.listdir(cache_dir)
+            full = process_msg_attachment("outer.msg", message.as_bytes())
+
+        # Neither container was cached, and entries inside containers never are
+        self.assertEqual(cached, [])
+        self.assertEqual(full["attachments"][0]["type"], "msg")
+        self.assertEqual(mock_extract_text_from_image.call_count, 1)
+
+    def test_evict_cache_removes_least_recently_used(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            for age, key in enumerate(["newest", "middle", "oldest"]):
+                path = os.path.join(cache_dir, f"{key}.json")
+                with open(path, "w") as f:
+                    f.write("x" * 100)
+                os.utime(path, (1000 - age, 1000 - age))
+
+            evict_cache(cache_dir, max_bytes=250)
+
+            self.assertEqual(sorted(os.listdir(cache_dir)), ["middle.json", "newest.json"])
+
 
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -1,12 +1,24 @@
+import re
+import threading
 import unittest
 from unittest.mock import MagicMock, patch
+
+import torch
+
+from complete_extraction_data import final_extraion_runner
 from complete_extraction_data.final_extraion_runner import (
+    get_model,
     preprocess_email,
     classify_email,
     extract_fields,
     analyze_intent,
     analyze_email,
+    analyze_emails,
+    email_windows,
+    classify_emails_windowed,
 )
+from tiny_model import build_tiny_model
+
 
 class TestFinalExtractionRunner(unittest.TestCase):
     @patch("complete_extraction_data.final_extraion_runner.extract_attachment_content")
@@ -50,6 +62,28 @@ class TestFinalExtractionRunner(unittest.TestCase):
         }
         self.assertEqual(result, expected_result)
 
+    def test_extract_fields_matches_per_pattern_scan(self):
+        texts = [
+            "ACCT#12345 Tel 555-1234567 Mobile: (303)262-8498",
+            "accountel: 1234567 contact: Jane\nAddress: 1 Main St\r\naddr 2",
+            "a@b@c x.y-z@mail.example.com, __@__ and @nobody",
+            "SSN 123-45-6789-12-3456 loan $1,000 amount: 2,500",
+            "Name: Zoë Ådams\nEmail: zoë@exämple.com account 98765",
+            "nothing to see here",
+            "",
+        ]
+        for text in texts:
+            expected = {}
+            for field, pattern in final_extraion_runner.FIELD_PATTERNS.items():
+                values = [m.group(1).strip() for m in re.finditer(pattern, text, re.IGNORECASE) if m.group(1)]
+                if values:
+                    expected[field] = values
+            self.assertEqual(extract_fields(text), expected, text)
+
+    def test_field_scan_rejects_ambiguous_keywords(self):
+        with self.assertRaises(ValueError):
+            final_extraion_runner._build_field_scan({"phone": ("tel",), "other": ("telex",)})
+
     def test_analyze_intent(self):
         text = "This is an urgent loan request."
         result = analyze_intent(text)
@@ -63,6 +97,18 @@ class TestFinalExtractionRunner(unittest.TestCase):
         result = analyze_intent(text)
         self.assertEqual(result, "loan_related")
 
+    @patch("complete_extraction_data.final_extraion_runner.INTENT_MAX_ATTACHMENT_CHARS", 20)
+    def test_analyze_intent_caps_attachment_text(self):
+        text = "Please help ATTACHMENTS: loan statement attached " + "x" * 100 + " URGENT"
+        self.assertEqual(analyze_intent(text), "loan_related")
+
+        text = "Please help ATTACHMENTS: " + "x" * 100 + " loan"
+        self.assertEqual(analyze_intent(text), "general_inquiry")
+
+        # The body is always scanned in full
+        text = "x" * 100 + " Update my ASAP ATTACHMENTS: " + "x" * 100
+        self.assertEqual(analyze_intent(text), "urgent")
+
     @patch("complete_extraction_data.final_extraion_runner.preprocess_email")
     @patch("complete_extraction_data.final_extraion_runner.classify_email")
     @patch("complete_extraction_data.final_extraion_runner.extract_fields")
@@ -85,5 +131,143 @@ class TestFinalExtractionRunner(unittest.TestCase):
         self.assertIn("processed_text", result)
         self.assertIn("analysis_date", result)
 
+    @patch("complete_extraction_data.final_extraion_runner.model", None)
+    @patch("complete_extraction_data.final_extraion_runner.tokenizer", None)
+    @patch("complete_extraction_data.final_extraion_runner.AutoTokenizer.from_pretrained")
+    @patch("complete_extraction_data.final_extraion_runner.AutoModelForSequenceClassification.from_pretrained")
+    def test_get_model_loads_once(self, mock_model_from_pretrained, mock_tokenizer_from_pretrained):
+        mock_model = MagicMock()
+        mock_model_from_pretrained.return_value = mock_model
+        mock_tokenizer_from_pretrained.return_value = "mock_tokenizer"
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(get_model())) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, [("mock_tokenizer", mock_model)] * 8)
+        mock_model_from_pretrained.assert_called_once_with("email_classifier_llm_latest")
+        mock_tokenizer_from_pretrained.assert_called_once_with("email_classifier_llm_latest")
+        mock_model.eval.assert_called_once_with()
+        self.assertIs(final_extraion_runner.model, mock_model)
+
+    @patch("complete_extraction_data.final_extraion_runner.model", None)
+    @patch("complete_extraction_data.final_extraion_runner.tokenizer", None)
+    @patch("complete_extraction_data.final_extraion_runner.print_model_diagnostics")
+    @patch("complete_extraction_data.final_extraion_runner.AutoTokenizer.from_pretrained")
+    @patch("complete_extraction_data.final_extraion_runner.AutoModelForSequenceClassification.from_pretrained")
+    def test_get_model_diagnostics_behind_verbose(self, mock_model_from_pretrained,
+                                                  mock_tokenizer_from_pretrained, mock_diagnostics):
+        get_model()
+        mock_diagnostics.assert_not_called()
+
+        with patch("complete_extraction_data.final_extraion_runner.VERBOSE", True), \
+                patch("complete_extraction_data.final_extraion_runner.model", None):
+            get_model()
+        mock_diagnostics.assert_called_once_with(mock_model_from_pretrained.return_value)
+
+    def test_analyze_emails_matches_analyze_email(self):
+        tiny_model, tiny_tokenizer = build_tiny_model(num_labels=4)
+        docs = [
+            {"subject": "urgent", "body": "please provide the loan status report"},
+            {"subject": "help", "body": ""},
+            {"subject": "update", "body": "Name: John\nAmount: $50,000",
+             "attachments": [{"type": "pdf", "content": "phone: 1234567 account 99887766"}]},
+            {"subject": "status", "body": "need help with my account " * 30},
+        ]
+
+        with patch("complete_extraction_data.final_extraion_runner.tokenizer", tiny_tokenizer), \
+                patch("complete_extraction_data.final_extraion_runner.model", tiny_model):
+            results = analyze_emails(docs, batch_size=2)
+            expected = [analyze_email(doc) for doc in docs]
+
+        self.assertEqual(len(results), len(docs))
+        for result, expected_result in zip(results, expected):
+            result.pop("analysis_date")
+            expected_result.pop("analysis_date")
+            self.assertEqual(result, expected_result)
+
+    def test_analyze_emails_empty(self):
+        self.assertEqual(analyze_emails([]), [])
+
+    def test_email_windows(self):
+        _, tiny_tokenizer = build_tiny_model(num_labels=4)
+        doc = {"subject": "urgent", "body": "please provide the loan status report",
+               "attachments": [{"type": "pdf", "content": "need help with my account " * 10}]}
+
+        windows = email_windows(doc, tiny_tokenizer, budget=20, window_size=8, overlap=2)
+
+        cls_id, sep_id = tiny_tokenizer.cls_token_id, tiny_tokenizer.sep_token_id
+        content = [window[1:-1] for window in windows]
+        self.assertTrue(all(window[0] == cls_id and window[-1] == sep_id for window in windows))
+        self.assertTrue(all(len(window) <= 8 for window in windows))
+        # Consecutive windows share two tokens
+        for previous, current in zip(content, content[1:]):
+            self.assertEqual(previous[-2:], current[:2])
+        # Subject and body first, then the attachment, cut to the budget
+        tokens = content[0] + [token for window in content[1:] for token in window[2:]]
+        expected = tiny_tokenizer("urgent please provide the loan status report attachments : "
+                                  + "need help with my account " * 10, add_special_tokens=False)["input_ids"]
+        self.assertEqual(tokens, expected[:20])
+
+    def test_email_windows_rejects_overlap_of_whole_window(self):
+        _, tiny_tokenizer = build_tiny_model(num_labels=4)
+        with self.assertRaises(ValueError):
+            email_windows({"subject": "help"}, tiny_tokenizer, window_size=8, overlap=6)
+
+    def test_classify_emails_windowed_averages_window_logits(self):
+        tiny_model, tiny_tokenizer = build_tiny_model(num_labels=4)
+        docs = [
+            {"subject": "help", "body": ""},
+            {"subject": "status", "body": "need help with my account " * 12,
+             "attachments": [{"type": "pdf", "content": "loan amount $50,000"}]},
+        ]
+
+        with patch("complete_extraction_data.final_extraion_runner.tokenizer", tiny_tokenizer), \
+                patch("complete_extraction_data.final_extraion_runner.model", tiny_model), \
+                patch("complete_extraction_data.final_extraion_runner.WINDOW_TOKEN_BUDGET", 40), \
+                patch("complete_extraction_data.final_extraion_runner.WINDOW_SIZE", 16), \
+                patch("complete_extraction_data.final_extraion_runner.WINDOW_OVERLAP", 4):
+            results = classify_emails_windowed(docs, batch_size=2)
+
+            for doc, (classification, confidence) in zip(docs, results):
+                windows = email_windows(doc, tiny_tokenizer)
+                with torch.no_grad():
+                    logits = torch.cat([tiny_model(input_ids=torch.tensor([window])).logits
+                                        for window in windows])
+                probabilities = torch.softmax(logits.mean(dim=0), dim=-1)
+                self.assertEqual(classification,
+                                 final_extraion_runner.label_mapping[int(probabilities.argmax())])
+                self.assertAlmostEqual(confidence, float(probabilities.max()), places=5)
+        self.assertGreater(len(email_windows(docs[1], tiny_tokenizer, budget=40, window_size=16, overlap=4)), 1)
+
+    def test_analyze_emails_matches_analyze_email_in_window_mode(self):
+        tiny_model, tiny_tokenizer = build_tiny_model(num_labels=4)
+        docs = [
+            {"subject": "urgent", "body": "please provide the loan status report"},
+            {"subject": "status", "body": "need help with my account " * 30,
+             "attachments": [{"type": "pdf", "content": "phone: 1234567 account 99887766"}]},
+        ]
+
+        with patch("complete_extraction_data.final_extraion_runner.tokenizer", tiny_tokenizer), \
+                patch("complete_extraction_data.final_extraion_runner.model", tiny_model), \
+                patch("complete_extraction_data.final_extraion_runner.CLASSIFICATION_MODE", "windows"), \
+                patch("complete_extraction_data.final_extraion_runner.WINDOW_SIZE", 32), \
+                patch("complete_extraction_data.final_extraion_runner.WINDOW_OVERLAP", 8):
+            results = analyze_emails(docs, batch_size=2)
+            expected = [analyze_email(doc) for doc in docs]
+
+        for result, expected_result in zip(results, expected):
+            result.pop("analysis_date")
+            expected_result.pop("analysis_date")
+            self.assertEqual(result, expected_result)
+
+    def test_unknown_classification_mode(self):
+        with patch("complete_extraction_data.final_extraion_runner.CLASSIFICATION_MODE", "sliding"):
+            with self.assertRaises(ValueError):
+                analyze_email({"subject": "help", "body": ""})
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -1,50 +1,64 @@
 import unittest
-from unittest.mock import patch, mock_open, MagicMock
+from unittest.mock import patch, mock_open
 import os
 import json
-from extract_data_from_emails_attachments.generate_emails_from_json import create_email_from_json_file
+import tempfile
+from email import message_from_bytes
+from extract_data_from_emails_attachments.generate_emails_from_json import (
+    create_email_from_json_file,
+    iter_json_array,
+)
+
+
+def write_dataset(folder, email_data_list):
+    json_file_path = os.path.join(folder, "emails.json")
+    with open(json_file_path, "w", encoding="utf-8") as json_file:
+        json.dump(email_data_list, json_file, indent=2)
+    return json_file_path
 
 
 class TestGenerateEmailsFromJson(unittest.TestCase):
-    @patch("builtins.open", new_callable=mock_open, read_data=json.dumps([
-        {
-            "email_id": "123",
-            "sender": "John Doe",
-            "sender_email": "john.doe@example.com",
-            "subject": "Test Email",
-            "body": "This is a test email.",
-            "attachments": ["file1.txt"],
-            "received_at": "2025-03-27T10:00:00.000",
-            "is_duplicate": True
-        }
-    ]))
-    @patch("os.makedirs")
-    @patch("os.path.exists")
-    @patch("os.path.join", side_effect=lambda *args: "/".join(args))
-    @patch("builtins.open", new_callable=mock_open)
-    def test_create_email_from_json_file(
-        self, mock_file_open, mock_path_join, mock_path_exists, mock_makedirs, mock_json_open
-    ):
-        # Mock os.path.exists to simulate attachment existence
-        mock_path_exists.side_effect = lambda path: "file1.txt" in path
-
-        # Call the function
-        create_email_from_json_file(
-            json_file_path="mock_json_file.json",
-            attachment_folder="mock_attachments",
-            output_folder="mock_output"
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.attachment_folder = os.path.join(self.tmp_dir.name, "attachments")
+        self.output_folder = os.path.join(self.tmp_dir.name, "output")
+        os.makedirs(self.attachment_folder)
+        with open(os.path.join(self.attachment_folder, "file1.txt"), "wb") as f:
+            f.write(b"Attachment content")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_create_email_from_json_file(self):
+        json_file_path = write_dataset(self.tmp_dir.name, [
+            {
+                "email_id": "123",
+                "sender": "John Doe",
+                "sender_email": "john.doe@example.com",
+                "subject": "Test Email",
+                "body": "This is a test email.",
+                "attachments": ["file1.txt"],
+                "received_at": "2025-03-27T10:00:00.000",
+                "is_duplicate": True
+            }
+        ])
+
+        written = create_email_from_json_file(
+            json_file_path=json_file_path,
+            attachment_folder=self.attachment_folder,
+            output_folder=self.output_folder
         )
 
-        # Assert that the output folder was created
-        mock_makedirs.assert_called_once_with("mock_output", exist_ok=True)
-
-        # Assert that the email file was written
-        self.assertEqual(mock_file_open.call_count, 2)  # One for primary email, one for duplicate
-        mock_file_open.assert_any_call("mock_output/123.eml", "w", encoding="utf-8")
-        mock_file_open.assert_any_call("mock_output/123_DUPLICATE.eml", "w", encoding="utf-8")
+        # One for primary email, one for duplicate
+        self.assertEqual(written, 2)
+        self.assertEqual(sorted(os.listdir(self.output_folder)), ["123.eml", "123_DUPLICATE.eml"])
 
-        # Assert that the attachment was read
-        mock_file_open.assert_any_call("mock_attachments/file1.txt", "rb")
+        with open(os.path.join(self.output_folder, "123.eml"), "rb") as f:
+            message = message_from_bytes(f.read())
+        self.assertEqual(message["Subject"], "Test Email")
+        attachments = [part for part in message.walk() if part.get_content_disposition() == "attachment"]
+        self.assertEqual(attachments[0].get_filename(), "file1.txt")
+        self.assertEqual(attachments[0].get_payload(decode=True), b"Attachment content")
 
     @patch("builtins.open", new_callable=mock_open, read_data=json.dumps([]))
     @patch("os.makedirs")
@@ -62,44 +76,64 @@ class TestGenerateEmailsFromJson(unittest.TestCase):
         # Assert that no emails were generated
         mock_json_open.assert_called_once_with("mock_json_file.json", "r", encoding="utf-8")
 
-    @patch("builtins.open", new_callable=mock_open, read_data=json.dumps([
-        {
-            "email_id": "123",
-            "sender": "John Doe",
-            "sender_email": "john.doe@example.com",
-            "subject": "Test Email",
-            "body": "This is a test email.",
-            "attachments": ["missing_file.txt"],
-            "received_at": "2025-03-27T10:00:00.000",
-            "is_duplicate": False
-        }
-    ]))
-    @patch("os.makedirs")
-    @patch("os.path.exists")
-    @patch("os.path.join", side_effect=lambda *args: "/".join(args))
-    @patch("builtins.open", new_callable=mock_open)
-    def test_create_email_with_missing_attachment(
-        self, mock_file_open, mock_path_join, mock_path_exists, mock_makedirs, mock_json_open
-    ):
-        # Mock os.path.exists to simulate missing attachment
-        mock_path_exists.side_effect = lambda path: False
-
-        # Call the function
-        create_email_from_json_file(
-            json_file_path="mock_json_file.json",
-            attachment_folder="mock_attachments",
-            output_folder="mock_output"
+    def test_create_email_with_missing_attachment(self):
+        json_file_path = write_dataset(self.tmp_dir.name, [
+            {
+                "email_id": "123",
+                "sender": "John Doe",
+                "sender_email": "john.doe@example.com",
+                "subject": "Test Email",
+                "body": "This is a test email.",
+                "attachments": ["missing_file.txt"],
+                "received_at": "2025-03-27T10:00:00.000",
+                "is_duplicate": False
+            }
+        ])
+
+        written = create_email_from_json_file(
+            json_file_path=json_file_path,
+            attachment_folder=self.attachment_folder,
+            output_folder=self.output_folder
         )
 
-        # Assert that the output folder was created
-        mock_makedirs.assert_called_once_with("mock_output", exist_ok=True)
-
-        # Assert that the email file was written
-        mock_file_open.assert_called_once_with("mock_output/123.eml", "w", encoding="utf-8")
-
-        # Assert that the missing attachment was logged
-        mock_file_open.assert_any_call("mock_json_file.json", "r", encoding="utf-8")
+        # The email is still written, without the missing attachment
+        self.assertEqual(written, 1)
+        with open(os.path.join(self.output_folder, "123.eml"), "rb") as f:
+            message = message_from_bytes(f.read())
+        self.assertFalse(any(part.get_content_disposition() == "attachment" for part in message.walk()))
+
+    def test_iter_json_array_streams_items(self):
+        items = [{"email_id": str(i), "body": "x" * i + " ] , { \" escaped"} for i in range(50)]
+        json_file_path = write_dataset(self.tmp_dir.name, items)
+
+        self.assertEqual(list(iter_json_array(json_file_path, read_size=7)), items)
+
+        # Numbers split across reads are not yielded in pieces
+        with open(json_file_path, "w", encoding="utf-8") as json_file:
+            json_file.write("[1, 234, 5]")
+        self.assertEqual(list(iter_json_array(json_file_path, read_size=5)), [1, 234, 5])
+
+    def test_create_email_from_json_file_in_parallel(self):
+        json_file_path = write_dataset(self.tmp_dir.name, [
+            {
+                "email_id": f"EML{i:03d}",
+                "sender": "John Doe",
+                "sender_email": "john.doe@example.com",
+                "subject": f"Test Email {i}",
+                "body": "This is a test email.",
+                "attachments": ["file1.txt"],
+                "received_at": "2025-03-27T10:00:00.000",
+                "is_duplicate": i % 2 == 0
+            }
+            for i in range(20)
+        ])
+
+        written = create_email_from_json_file(
+            json_file_path, self.attachment_folder, self.output_folder, processes=2, chunksize=3)
+
+        self.assertEqual(written, 30)
+        self.assertEqual(len(os.listdir(self.output_folder)), 30)
 
 
 if __name__ == "__main__":
-    unittest.main()
\ No newline at end of file
+    unittest.main()
@@ -1,25 +1,178 @@
 import unittest
 from unittest.mock import patch, MagicMock
-from runner.main import main
+from runner.main import main, compute_shard_ranges, plan_shards, classify_shard, run_sharded, pending_query
 
 class TestMainRunner(unittest.TestCase):
+    @patch("runner.main.NUM_SHARDS", 1)
+    @patch("runner.main.get_model_version", return_value="v1")
     @patch("runner.main.load_model")
     @patch("runner.main.connect_to_mongodb")
-    @patch("runner.main.classify_email")
-    @patch("runner.main.update_email_document")
-    def test_main(self, mock_update_email_document, mock_classify_email, mock_connect_to_mongodb, mock_load_model):
+    @patch("runner.main.classify_emails")
+    @patch("runner.main.PredictionWriter")
+    def test_main(self, mock_prediction_writer, mock_classify_email, mock_connect_to_mongodb, mock_load_model,
+                  mock_get_model_version):
         mock_load_model.return_value = ("mock_model", "mock_tokenizer")
         mock_collection = MagicMock()
         mock_collection.find.return_value = [{"_id": 1, "subject": "Test", "body": "Body"}]
         mock_connect_to_mongodb.return_value = mock_collection
-        mock_classify_email.return_value = ("label", 0.9, ["token1", "token2"])
+        mock_classify_email.return_value = [("label", 0.9, ["token1", "token2"])]
 
         main()
 
         mock_load_model.assert_called_once()
         mock_connect_to_mongodb.assert_called_once()
-        mock_classify_email.assert_called_once()
-        mock_update_email_document.assert_called_once()
+        mock_classify_email.assert_called_once_with(["Test Body"], "mock_model", "mock_tokenizer")
+        mock_prediction_writer.assert_called_once_with(mock_collection)
+        writer = mock_prediction_writer.return_value.__enter__.return_value
+        writer.add.assert_called_once_with(1, "label", 0.9, ["token1", "token2"], "v1")
+        mock_collection.find.assert_called_once_with(pending_query("v1"), {"subject": 1, "body": 1})
+
+    def test_pending_query(self):
+        self.assertEqual(pending_query("v1", incremental=False), {})
+        self.assertEqual(pending_query("v1", incremental=True), {"$or": [
+            {"predicted_label": {"$exists": False}},
+            {"confidence_score": {"$exists": False}},
+            {"model_version": {"$ne": "v1"}},
+        ]})
+
+    @patch("runner.main.NUM_SHARDS", 4)
+    @patch("runner.main.run_sharded", return_value=[])
+    def test_main_sharded(self, mock_run_sharded):
+        main()
+        mock_run_sharded.assert_called_once_with()
+
+    def test_compute_shard_ranges(self):
+        mock_collection = MagicMock()
+        mock_collection.aggregate.return_value = [
+            {"_id": {"min": 1, "max": 40}, "count": 39},
+            {"_id": {"min": 40, "max": 80}, "count": 40},
+            {"_id": {"min": 80, "max": 99}, "count": 20},
+        ]
+
+        ranges = compute_shard_ranges(mock_collection, 3, {"predicted_label": {"$exists": False}})
+
+        self.assertEqual(ranges, [(1, 40, False), (40, 80, False), (80, 99, True)])
+        pipeline = mock_collection.aggregate.call_args.args[0]
+        self.assertEqual(pipeline, [
+            {"$match": {"predicted_label": {"$exists": False}}},
+            {"$bucketAuto": {"groupBy": "$_id", "buckets": 3}},
+        ])
+
+    def test_plan_shards_resumes_unfinished_run(self):
+        mock_collection = MagicMock(full_name="db.emails")
+        mock_checkpoints = MagicMock()
+        mock_checkpoints.find.return_value.sort.return_value = [
+            {"shard_id": 0, "lower": 1, "upper": 50, "last": False, "done": True},
+            {"shard_id": 1, "lower": 50, "upper": 99, "last": True, "done": False},
+        ]
+
+        ranges = plan_shards(mock_collection, mock_checkpoints, 8)
+
+        self.assertEqual(ranges, [(1, 50, False), (50, 99, True)])
+        mock_collection.aggregate.assert_not_called()
+        mock_checkpoints.insert_one.assert_not_called()
+
+    def test_plan_shards_starts_fresh_after_finished_run(self):
+        mock_collection = MagicMock(full_name="db.emails")
+        mock_collection.aggregate.return_value = [{"_id": {"min": 1, "max": 99}}]
+        mock_checkpoints = MagicMock()
+        mock_checkpoints.find.return_value.sort.return_value = [
+            {"shard_id": 0, "lower": 1, "upper": 50, "last": True, "done": True},
+        ]
+
+        ranges = plan_shards(mock_collection, mock_checkpoints, 1)
+
+        self.assertEqual(ranges, [(1, 99, True)])
+        mock_checkpoints.delete_many.assert_called_once_with({"collection": "db.emails"})
+        checkpoint = mock_checkpoints.insert_one.call_args.args[0]
+        self.assertEqual(checkpoint["_id"], "db.emails:0")
+        self.assertIsNone(checkpoint["last_id"])
+        self.assertFalse(checkpoint["done"])
+
+    @patch("runner.main.DOCUMENT_CHUNK_SIZE", 2)
+    @patch("runner.main.torch.set_num_threads")
+    @patch("runner.main.load_model", return_value=("mock_model", "mock_tokenizer"))
+    @patch("runner.main.connect_to_mongodb")
+    @patch("runner.main.classify_chunk")
+    @patch("runner.main.INCREMENTAL", False)
+    @patch("runner.main.PredictionWriter")
+    def test_classify_shard_resumes_after_checkpoint(self, mock_prediction_writer, mock_classify_chunk,
+                                                     mock_connect_to_mongodb, mock_load_model,
+                                                     mock_set_num_threads):
+        mock_collection = MagicMock(full_name="db.emails")
+        mock_connect_to_mongodb.return_value = mock_collection
+        mock_checkpoints = mock_collection.database.__getitem__.return_value
+        mock_checkpoints.find_one.return_value = {"last_id": 5, "done": False}
+        mock_collection.find.return_value.sort.return_value.limit.side_effect = [
+            [{"_id": 6}, {"_id": 7}],
+            [{"_id": 8}],
+            [],
+        ]
+
+        classify_shard(1, 0, 10, False, threads=3, model_version="v1")
+
+        mock_set_num_threads.assert_called_once_with(3)
+        queries = [call.args[0] for call in mock_collection.find.call_args_list]
+        self.assertEqual(queries, [
+            {"_id": {"$lt": 10, "$gt": 5}},
+            {"_id": {"$lt": 10, "$gt": 7}},
+            {"_id": {"$lt": 10, "$gt": 8}},
+        ])
+        self.assertEqual(mock_classify_chunk.call_count, 2)
+        self.assertEqual(mock_classify_chunk.call_args.args[-1], "v1")
+        # Predictions are flushed before every checkpoint
+        self.assertEqual(mock_prediction_writer.return_value.flush.call_count, 2)
+        mock_checkpoints.update_one.assert_any_call({"_id": "db.emails:1"}, {"$set": {"last_id": 8}})
+        self.assertEqual(mock_checkpoints.update_one.call_args.args,
+                         ({"_id": "db.emails:1"}, {"$set": {"done": True}}))
+
+    @patch("runner.main.DOCUMENT_CHUNK_SIZE", 2)
+    @patch("runner.main.torch.set_num_threads")
+    @patch("runner.main.load_model", return_value=("mock_model", "mock_tokenizer"))
+    @patch("runner.main.connect_to_mongodb")
+    @patch("runner.main.classify_chunk")
+    def test_classify_shard_only_reads_pending_documents(self, mock_classify_chunk, mock_connect_to_mongodb,
+                                                         mock_load_model, mock_set_num_threads):
+        mock_collection = MagicMock(full_name="db.emails")
+        mock_connect_to_mongodb.return_value = mock_collection
+        mock_collection.database.__getitem__.return_value.find_one.return_value = None
+        mock_collection.find.return_value.sort.return_value.limit.side_effect = [[]]
+
+        classify_shard(0, 0, 10, True, model_version="v1")
+
+        mock_collection.find.assert_called_once_with(
+            {"$and": [{"_id": {"$lte": 10, "$gte": 0}}, pending_query("v1", incremental=True)]},
+            {"subject": 1, "body": 1},
+        )
+
+    @patch("runner.main.load_model")
+    @patch("runner.main.connect_to_mongodb")
+    def test_classify_shard_skips_finished_shard(self, mock_connect_to_mongodb, mock_load_model):
+        mock_collection = MagicMock(full_name="db.emails")
+        mock_connect_to_mongodb.return_value = mock_collection
+        mock_collection.database.__getitem__.return_value.find_one.return_value = {"done": True}
+
+        classify_shard(0, 0, 10, True)
+
+        mock_load_model.assert_not_called()
+        mock_collection.find.assert_not_called()
+
+    @patch("runner.main.get_model_version", return_value="v1")
+    @patch("runner.main.multiprocessing.Process")
+    @patch("runner.main.plan_shards", return_value=[(1, 50, False), (50, 99, True)])
+    @patch("runner.main.connect_to_mongodb")
+    def test_run_sharded(self, mock_connect_to_mongodb, mock_plan_shards, mock_process, mock_get_model_version):
+        processes = [MagicMock(exitcode=0), MagicMock(exitcode=1)]
+        mock_process.side_effect = processes
+
+        failed = run_sharded(num_shards=2, threads_per_shard=1)
+
+        self.assertEqual(failed, [1])
+        self.assertEqual([call.kwargs["args"] for call in mock_process.call_args_list],
+                         [(0, 1, 50, False, 1, "v1"), (1, 50, 99, True, 1, "v1")])
+        for process in processes:
+            process.start.assert_called_once()
+            process.join.assert_called_once()
 
 if __name__ == "__main__":
-    unittest.main()
\ No newline at end of file
+    unittest.main()
@@ -1,6 +1,14 @@
+import os
+import tempfile
 import unittest
 from unittest.mock import patch
-from runner.model_loader import load_model
+
+import torch
+
+from runner.email_classifier import classify_emails
+from runner.model_loader import load_model, export_onnx_model, get_model_version
+from tiny_model import build_tiny_model
+
 
 class TestModelLoader(unittest.TestCase):
     @patch("runner.model_loader.AutoTokenizer.from_pretrained")
@@ -16,5 +24,66 @@ class TestModelLoader(unittest.TestCase):
         mock_model.assert_called_once()
         mock_tokenizer.assert_called_once()
 
+    @patch("runner.model_loader.AutoTokenizer.from_pretrained")
+    @patch("runner.model_loader.AutoModelForSequenceClassification.from_pretrained")
+    def test_load_quantized_model(self, mock_model, mock_tokenizer):
+        model, tokenizer = build_tiny_model()
+        mock_model.return_value = model
+        mock_tokenizer.return_value = tokenizer
+
+        quantized, _ = load_model(backend="quantized")
+
+        self.assertIsInstance(quantized.classifier, torch.ao.nn.quantized.dynamic.Linear)
+        texts = ["please provide the loan status report", "need help with my account update"]
+        expected = classify_emails(texts, model, tokenizer, attribution="off")
+        results = classify_emails(texts, quantized, tokenizer, attribution="off")
+        for (label, confidence, _), (expected_label, expected_confidence, _) in zip(results, expected):
+            self.assertAlmostEqual(confidence, expected_confidence, places=1)
+
+    def test_onnx_backend_matches_pytorch(self):
+        try:
+            import onnxruntime  # noqa: F401
+        except ImportError:
+            self.skipTest("onnxruntime is not installed")
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            model, tokenizer = build_tiny_model()
+            tokenizer.save_pretrained(tmp_dir)
+            export_onnx_model(model, tokenizer, os.path.join(tmp_dir, "model.onnx"))
+
+            onnx_model, onnx_tokenizer = load_model(tmp_dir, backend="onnx")
+
+            texts = ["please provide the loan status report", "help", "need help with my account update"]
+            expected = classify_emails(texts, model, tokenizer, attribution="topk", top_k=3)
+            results = classify_emails(texts, onnx_model, onnx_tokenizer, attribution="topk", top_k=3)
+
+        for (label, confidence, tokens), (expected_label, expected_confidence, expected_tokens) in zip(
+                results, expected):
+            self.assertEqual(label, expected_label)
+            self.assertAlmostEqual(confidence, expected_confidence, places=5)
+            self.assertEqual([t["token"] for t in tokens], [t["token"] for t in expected_tokens])
+
+    def test_get_model_version(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            with open(os.path.join(tmp_dir, "config.json"), "w") as f:
+                f.write("{}")
+            with open(os.path.join(tmp_dir, "model.safetensors"), "wb") as f:
+                f.write(b"weights")
+            version = get_model_version(tmp_dir)
+
+            # The exported ONNX model does not change the version
+            with open(os.path.join(tmp_dir, "model.onnx"), "wb") as f:
+                f.write(b"onnx")
+            self.assertEqual(get_model_version(tmp_dir), version)
+
+            with open(os.path.join(tmp_dir, "model.safetensors"), "wb") as f:
+                f.write(b"retrained weights")
+            self.assertNotEqual(get_model_version(tmp_dir), version)
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            load_model(backend="tensorrt")
+
+
 if __name__ == "__main__":
-    unittest.main()
\ No newline at end of file
+    unittest.main()
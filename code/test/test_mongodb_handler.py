@@ -1,6 +1,7 @@
 import unittest
 from unittest.mock import patch, MagicMock
-from runner.mongodb_handler import connect_to_mongodb, update_email_document
+from pymongo.errors import BulkWriteError
+from runner.mongodb_handler import connect_to_mongodb, update_email_document, PredictionWriter
 
 class TestMongoDBHandler(unittest.TestCase):
     @patch("runner.mongodb_handler.MongoClient")
@@ -25,5 +26,62 @@ class TestMongoDBHandler(unittest.TestCase):
             {"$set": {"predicted_label": "label", "confidence_score": 0.9, "important_tokens": ["token1", "token2"]}},
         )
 
+    def test_update_email_document_with_model_version(self):
+        mock_collection = MagicMock()
+
+        update_email_document(mock_collection, 1, "label", 0.9, [], model_version="v1")
+
+        mock_collection.update_one.assert_called_once_with(
+            {"_id": 1},
+            {"$set": {"predicted_label": "label", "confidence_score": 0.9, "important_tokens": [],
+                      "model_version": "v1"}},
+        )
+
+    def test_prediction_writer_flushes_by_count(self):
+        mock_collection = MagicMock()
+        mock_collection.bulk_write.return_value = MagicMock(matched_count=2, modified_count=1)
+
+        with PredictionWriter(mock_collection, batch_size=2, flush_interval=60) as writer:
+            writer.add(1, "update", 0.9, [], "v1")
+            mock_collection.bulk_write.assert_not_called()
+            writer.add(2, "request", 0.8, [], "v1")
+            self.assertEqual(mock_collection.bulk_write.call_count, 1)
+            writer.add(3, "request", 0.7, [], "v1")
+
+        self.assertEqual(mock_collection.bulk_write.call_count, 2)
+        operations = mock_collection.bulk_write.call_args_list[0].args[0]
+        self.assertEqual(operations[0]._filter, {"_id": 1})
+        self.assertEqual(operations[0]._doc, {"$set": {
+            "predicted_label": "update", "confidence_score": 0.9, "important_tokens": [], "model_version": "v1"}})
+        self.assertEqual(mock_collection.bulk_write.call_args.kwargs, {"ordered": False})
+        self.assertEqual(writer.close(), {"matched_count": 4, "modified_count": 2, "failed_ids": []})
+
+    @patch("runner.mongodb_handler.time.monotonic")
+    def test_prediction_writer_flushes_by_time(self, mock_monotonic):
+        mock_collection = MagicMock()
+        mock_monotonic.side_effect = [0.0, 1.0, 6.0]
+
+        writer = PredictionWriter(mock_collection, batch_size=100, flush_interval=5.0)
+        writer.add(1, "update", 0.9, [])
+        mock_collection.bulk_write.assert_not_called()
+        writer.add(2, "update", 0.9, [])
+
+        mock_collection.bulk_write.assert_called_once()
+
+    def test_prediction_writer_reports_failed_ids(self):
+        mock_collection = MagicMock()
+        mock_collection.bulk_write.side_effect = [
+            BulkWriteError({"nMatched": 2, "nModified": 2,
+                            "writeErrors": [{"index": 1, "errmsg": "document too large"}]}),
+            Exception("connection lost"),
+        ]
+
+        writer = PredictionWriter(mock_collection, batch_size=3)
+        for doc_id in (1, 2, 3, 4):
+            writer.add(doc_id, "update", 0.9, [])
+        totals = writer.close()
+
+        self.assertEqual(totals, {"matched_count": 2, "modified_count": 2, "failed_ids": [2, 4]})
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
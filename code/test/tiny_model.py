@@ -0,0 +1,30 @@
+import os
+import tempfile
+
+import torch
+from transformers import BertConfig, BertForSequenceClassification, BertTokenizerFast
+
+VOCAB = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]", "please", "provide", "the", "loan",
+         "status", "report", "need", "help", "with", "my", "account", "update", "progress",
+         "urgent", "attachments", ":", "name", "john", "amount", "$", "50", ",", "000", "phone"]
+
+
+def build_tiny_model(num_labels=2):
+    """
+    Small randomly initialised BERT classifier and tokenizer for CPU tests.
+
+    Returns (model, tokenizer), the order load_model uses. The eager attention
+    implementation is used so attention weights are returned.
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        vocab_file = os.path.join(tmp_dir, "vocab.txt")
+        with open(vocab_file, "w", encoding="utf-8") as f:
+            f.write("\n".join(VOCAB))
+        tokenizer = BertTokenizerFast(vocab_file)
+    torch.manual_seed(0)
+    config = BertConfig(vocab_size=len(VOCAB), hidden_size=32, num_hidden_layers=2,
+                        num_attention_heads=2, intermediate_size=64, num_labels=num_labels,
+                        attn_implementation="eager")
+    model = BertForSequenceClassification(config)
+    model.eval()
+    return model, tokenizer